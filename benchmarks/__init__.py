@@ -0,0 +1,10 @@
+"""
+Benchmarks for pyrules hot paths. Run the suite, optionally against a
+baseline (see benchmarks.run):
+
+    python -m benchmarks.run -o results.json -b baseline.json
+
+or a single benchmark module directly, e.g.
+
+    python -m benchmarks.actions
+"""
@@ -0,0 +1,47 @@
+"""
+Compare eval-ing TableRule action source strings on every row hit with
+running the actions precompiled by TableRule.
+"""
+import timeit
+from pyrules import RuleContext, TableRule
+
+
+ROWS = 500
+
+
+def make_table(rows=ROWS):
+    return TableRule([
+        {'if': [True],
+         'then': ['context.value * {} + 1'.format(i)],
+         'target': ['result{}'.format(i)]}
+        for i in xrange(rows)])
+
+
+def perform_uncompiled(trule, context):
+    # The former TableRule.perform action path: eval the raw source string.
+    for rule in trule.rules:
+        for action, target in zip(rule['then'], rule['target']):
+            context[target.replace('context.', '').strip()] = (
+                eval(action, {'context': context})
+                if isinstance(action, basestring)
+                else action)
+
+
+def perform_compiled(trule, context):
+    for index in xrange(len(trule.rules)):
+        for target, action in trule._actions[index]:
+            context[target] = action(context)
+
+
+def main(number=20):
+    trule = make_table()
+    for func in (perform_uncompiled, perform_compiled):
+        context = RuleContext({'value': 3})
+        elapsed = min(timeit.repeat(
+            lambda: func(trule, context), repeat=3, number=number))
+        print '{:<20} {:>8.2f} ms/table'.format(
+            func.__name__, elapsed / number * 1000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Microbenchmarks of RuleContext get/set/update/to_dict/fork against the
+former DictObject based implementation.
+"""
+import timeit
+from pyrules import DictObject, RuleContext
+
+
+class LegacyRuleContext(DictObject):
+    # RuleContext as it was before it got __slots__
+    def __init__(self, initial=None):
+        super(LegacyRuleContext, self).__init__(initial=initial)
+        self._executed = []
+
+    def __setitem__(self, item, value):
+        self.__setattr__(item, value)
+
+    def __getitem__(self, item):
+        if item.startswith('_'):
+            raise KeyError('Key {} not found'.format(item))
+        else:
+            try:
+                return self.__getattr__(item)
+            except AttributeError:
+                raise KeyError('Key {} not found'.format(item))
+
+    def to_dict(self):
+        return dict(self._data)
+
+    def fork(self):
+        return LegacyRuleContext(self._data)
+
+
+DATA = dict(('key{}'.format(i), i) for i in xrange(100))
+
+CASES = [
+    ('getattr', lambda context: context.key1),
+    ('getitem', lambda context: context['key1']),
+    ('setattr', lambda context: setattr(context, 'key1', 1)),
+    ('setitem', lambda context: context.__setitem__('key1', 1)),
+    ('update', lambda context: context.update({'key1': 1, 'key2': 2})),
+    ('to_dict', lambda context: context.to_dict()),
+    ('fork', lambda context: context.fork()),
+]
+
+
+def main(number=100000):
+    print '{:<10} {:>12} {:>12}'.format('', 'legacy', 'RuleContext')
+    for name, func in CASES:
+        timings = []
+        for cls in (LegacyRuleContext, RuleContext):
+            context = cls(DATA)
+            timings.append(min(timeit.repeat(
+                lambda: func(context), repeat=3, number=number)))
+        print '{:<10} {:>9.0f} ns {:>9.0f} ns'.format(
+            name, *[timing / number * 1e9 for timing in timings])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Time importing pyrules in fresh interpreters, for the plain package and
+for the parts that load YAML, pyparsing and Django.
+"""
+import os
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STATEMENTS = [
+    'import pyrules',
+    'from pyrules import ConditionalRule, RuleEngine',
+    'from pyrules import TableRule',
+    'from pyrules import TableRule; TableRule.from_yaml("rules: []")',
+    'from pyrules.conditions import boolExpr; boolExpr.parseString("1")',
+    'from pyrules import RuleStore',
+]
+
+SCRIPT = """
+import time
+started = time.time()
+{}
+print(time.time() - started)
+"""
+
+
+def measure(statement, repeat=5):
+    env = dict(os.environ)
+    env.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+    return min(
+        float(subprocess.check_output(
+            [sys.executable, '-c', SCRIPT.format(statement)],
+            cwd=ROOT, env=env))
+        for i in xrange(repeat))
+
+
+def main():
+    for statement in STATEMENTS:
+        print '{:>8.1f} ms  {}'.format(measure(statement) * 1000, statement)
+
+
+if __name__ == '__main__':
+    main()
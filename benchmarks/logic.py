@@ -0,0 +1,44 @@
+"""
+Compare parsing TableRule logic strings with the pyparsing grammar and with
+the fast parser, and loading a table with many rows.
+"""
+import timeit
+from pyrules import TableRule
+from pyrules.conditions import LogicEvaluator, boolExpr, parse_logic_tree
+
+
+ROWS = 500
+LOGIC = ['1 & 2', '1 & (2 | 3)', '~1 & 2 & 3', '(1 | 2) ^ ~3']
+
+
+def parse_pyparsing(logic):
+    return LogicEvaluator.to_c_expression(boolExpr.parseString(logic)[0])
+
+
+def parse_fast(logic):
+    return LogicEvaluator.to_c_expression(parse_logic_tree(logic))
+
+
+def load_table(rows=ROWS):
+    LogicEvaluator._parsed.clear()
+    return TableRule([
+        {'if': {'logic': LOGIC[i % len(LOGIC)],
+                'conditions': [{'a__gt': i}, {'b': i}, 'c']},
+         'then': ['1'], 'target': ['result']}
+        for i in xrange(rows)])
+
+
+def main(number=200):
+    for func in (parse_pyparsing, parse_fast):
+        elapsed = min(timeit.repeat(
+            lambda: [func(logic) for logic in LOGIC], repeat=3,
+            number=number))
+        print '{:<20} {:>8.1f} us/logic'.format(
+            func.__name__, elapsed / number / len(LOGIC) * 1e6)
+    elapsed = min(timeit.repeat(load_table, repeat=3, number=1))
+    print '{:<20} {:>8.1f} ms/{} rows'.format(
+        'load_table', elapsed * 1000, ROWS)
+
+
+if __name__ == '__main__':
+    main()
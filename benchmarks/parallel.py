@@ -0,0 +1,50 @@
+"""
+Scaling of ParallelRuleEngine.execute_batch with the number of worker
+processes, compared with executing every context in this process.
+"""
+import random
+import time
+from pyrules import ParallelRuleEngine, RuleContext, RuleEngine, TableRule
+
+
+def make_table(rows=200):
+    rnd = random.Random(0)
+    return TableRule([
+        {'if': {'logic': '1 & (2 | 3)', 'conditions': [
+            {'amount__gt': rnd.randint(0, 1000)},
+            {'country': rnd.choice(['CH', 'DE', 'FR'])},
+            {'user__age__gte': rnd.randint(18, 80)}]},
+         'then': ['context.amount * {}'.format(i)],
+         'target': ['result']}
+        for i in xrange(rows)])
+
+
+def make_records(count=5000):
+    rnd = random.Random(1)
+    return [
+        {'amount': rnd.randint(0, 1000),
+         'country': rnd.choice(['CH', 'DE', 'FR', 'IT']),
+         'user': {'age': rnd.randint(18, 80)}}
+        for i in xrange(count)]
+
+
+def main(processes=(1, 2, 4, 8)):
+    ruleset = [make_table()]
+    records = make_records()
+    start = time.time()
+    engine = RuleEngine()
+    for record in records:
+        engine.execute(ruleset, RuleContext(record))
+    baseline = time.time() - start
+    print '{:<12} {:>8.2f} s'.format('in process', baseline)
+    for count in processes:
+        engine = ParallelRuleEngine(processes=count, chunksize=500)
+        start = time.time()
+        engine.execute_batch(ruleset, records)
+        elapsed = time.time() - start
+        print '{:<12} {:>8.2f} s {:>6.2f}x'.format(
+            '{} workers'.format(count), elapsed, baseline / elapsed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,288 @@
+"""
+Benchmark suite for pyrules hot paths. Runs all benchmarks, saves results as
+JSON and compares them with a baseline, by default the one committed in
+benchmarks/baseline.json:
+
+    python -m benchmarks.run -t 0.2
+    python -m benchmarks.run -b results.json
+    python -m benchmarks.run --no-baseline -o results.json
+
+Exits with status 1 if a benchmark is slower than its baseline by more than
+the threshold (a fraction, 0.2 is 20%). Benchmarks whose dependencies are
+missing are skipped. Timings depend on the machine, regenerate the baseline
+with -o benchmarks/baseline.json when comparing on another one.
+"""
+import argparse
+import importlib
+import json
+import os
+import sys
+import timeit
+import yaml
+from pyrules import RuleContext, TableRule
+from pyrules.conditions import LogicEvaluator, expression_handler
+from . import synthetic
+
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+# (name, required modules, setup), setup returns (func, operations per call)
+BENCHMARKS = []
+
+
+def benchmark(name, requires=()):
+    def register(setup):
+        BENCHMARKS.append((name, requires, setup))
+        return setup
+    return register
+
+
+def contexts(count, path_depth=1):
+    return [
+        RuleContext(data)
+        for data in synthetic.make_contexts(count, path_depth)]
+
+
+def register_logic(depth):
+    @benchmark('logic_evaluate[depth={}]'.format(depth))
+    def setup():
+        evaluators = [
+            LogicEvaluator(row['if']['logic'], row['if']['conditions'])
+            for row in synthetic.make_rows(50, logic_depth=depth)]
+        ctxs = contexts(20)
+
+        def run():
+            for context in ctxs:
+                for evaluator in evaluators:
+                    evaluator.evaluate(context)
+        return run, len(evaluators) * len(ctxs)
+
+
+def register_expression(depth):
+    @benchmark('expression_evaluate[path={}]'.format(depth))
+    def setup():
+        expression = synthetic.path(depth) + '__gt'
+        ctxs = contexts(1000, depth)
+
+        def run():
+            for context in ctxs:
+                expression_handler.evaluate(expression, context, 500)
+        return run, len(ctxs)
+
+
+def register_table(rows, indexed=False):
+    name = 'table_perform_indexed' if indexed else 'table_perform'
+
+    @benchmark('{}[rows={}]'.format(name, rows))
+    def setup():
+        trule = TableRule(synthetic.make_rows(rows), indexed=indexed)
+        ctxs = contexts(max(1, 1000 // rows))
+
+        def run():
+            for context in ctxs:
+                trule.perform(context)
+        return run, len(ctxs)
+
+
+def register_yaml(rows):
+    @benchmark('table_from_yaml[rows={}]'.format(rows))
+    def setup():
+        text = yaml.dump({'rules': synthetic.make_rows(rows)})
+
+        def run():
+            LogicEvaluator._parsed.clear()
+            TableRule.from_yaml(text)
+        return run, 1
+
+
+for depth in (1, 2, 4):
+    register_logic(depth)
+for depth in (1, 3, 5):
+    register_expression(depth)
+for rows in (10, 100, 10000):
+    register_table(rows)
+register_table(10000, indexed=True)
+for rows in (10, 100, 1000):
+    register_yaml(rows)
+
+
+_database = []
+
+
+def setup_django():
+    """
+    Create an in-memory database with a ruleset 'Bench' of 20 tables, once.
+    The app's database is never used. It's closed by teardown_django.
+    """
+    if _database:
+        return
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+    from django.conf import settings
+    settings.DATABASES = {'default': {
+        'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}}
+    from django.core.management import call_command
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+    from pyrules import models
+    setup_test_environment()
+    call_command('syncdb', interactive=False, verbosity=0)
+    _database.append(connection)
+    ruleset = models.Ruleset.objects.create(name='Bench')
+    for i in xrange(20):
+        trule = models.TableRule.objects.create(
+            name='Bench{}'.format(i), slug='bench{}'.format(i),
+            tablerule_format=models.TableRule.TF_JSON,
+            definition=json.dumps(
+                {'rules': synthetic.make_rows(100, seed=i)}))
+        models.RulePosition.objects.create(
+            rule=trule, ruleset=ruleset, priority=i)
+
+
+def teardown_django():
+    if _database:
+        _database.pop().close()
+
+
+@benchmark('storage_get_ruleset', requires=('django',))
+def setup_storage():
+    setup_django()
+    from pyrules.storages.django import DjangoStorage
+    storage = DjangoStorage()
+    return lambda: storage.get_ruleset('Bench'), 1
+
+
+@benchmark('store_get_ruleset_cached', requires=('django',))
+def setup_store():
+    setup_django()
+    from pyrules.storage import RuleStore
+    store = RuleStore()
+    return lambda: store.get_ruleset('Bench'), 1
+
+
+@benchmark('cached_storage_get_ruleset', requires=('django',))
+def setup_cached_storage():
+    setup_django()
+    from pyrules.storages.cache import CachedStorage
+    storage = CachedStorage()
+    return lambda: storage.get_ruleset('Bench'), 1
+
+
+@benchmark('api_ruleset_post', requires=('django', 'tastypie', 'tpasync'))
+def setup_api():
+    setup_django()
+    from django.test.client import Client
+    client = Client()
+    data = [json.dumps(context) for context in synthetic.make_contexts(20)]
+
+    def run():
+        for body in data:
+            client.post(
+                '/api/v1/ruleset/Bench/', data=body,
+                content_type='application/json')
+    return run, len(data)
+
+
+@benchmark('api_ruleset_batch', requires=('django', 'tastypie', 'tpasync'))
+def setup_api_batch():
+    setup_django()
+    from django.test.client import Client
+    client = Client()
+    body = '\n'.join(
+        json.dumps(context) for context in synthetic.make_contexts(200))
+
+    def run():
+        response = client.post(
+            '/api/v1/ruleset/Bench/batch/', data=body,
+            content_type='application/x-ndjson')
+        ''.join(response.streaming_content)
+    return run, 200
+
+
+def missing(requires):
+    for name in requires:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            return name
+
+
+def run(pattern=None, repeat=3):
+    """
+    Run benchmarks with pattern in their name, returns the results dict.
+    """
+    results = {'python': sys.version.split()[0], 'results': {},
+               'skipped': {}}
+    for name, requires, setup in BENCHMARKS:
+        if pattern and pattern not in name:
+            continue
+        module = missing(requires)
+        if module:
+            results['skipped'][name] = 'requires {}'.format(module)
+            print '{:<40} skipped, requires {}'.format(name, module)
+            continue
+        try:
+            func, operations = setup()
+            func()
+            seconds = min(timeit.repeat(func, repeat=repeat, number=1))
+        except Exception:
+            teardown_django()
+            raise
+        results['results'][name] = seconds / operations
+        print '{:<40} {:>12.2f} us/op'.format(
+            name, seconds / operations * 1e6)
+    teardown_django()
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Return the names of benchmarks slower than baseline by more than
+    threshold.
+    """
+    regressions = []
+    for name, seconds in sorted(results['results'].items()):
+        before = baseline['results'].get(name)
+        if not before:
+            continue
+        change = seconds / before - 1
+        regressed = change > threshold
+        print '{:<40} {:>+8.1%}{}'.format(
+            name, change, '  REGRESSION' if regressed else '')
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-o', '--output', help='save results as JSON')
+    parser.add_argument(
+        '-b', '--baseline', default=BASELINE,
+        help='JSON results to compare, defaults to benchmarks/baseline.json')
+    parser.add_argument(
+        '--no-baseline', dest='baseline', action='store_const', const=None,
+        help="don't compare with a baseline")
+    parser.add_argument(
+        '-t', '--threshold', type=float, default=0.2,
+        help='allowed slowdown against the baseline, 0.2 is 20%%')
+    parser.add_argument('-k', '--pattern', help='only run matching names')
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+    baseline = None
+    if args.baseline:
+        # Read first, the output may replace the baseline
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    results = run(args.pattern, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(
+                results, f, indent=2, sort_keys=True, separators=(',', ': '))
+            f.write('\n')
+    if baseline and compare(results, baseline, args.threshold):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""
+Synthetic rule tables and contexts for benchmarks. Generators are seeded,
+so every run measures the same data.
+"""
+import random
+
+
+COUNTRIES = ['CH', 'DE', 'FR', 'IT']
+OPS = ['gt', 'gte', 'lt', 'lte']
+
+
+def path(depth):
+    """
+    Return the context path of a value nested depth levels deep, i.e.
+    'customer__account__amount' for depth 3.
+    """
+    return '__'.join(['customer', 'account', 'limits', 'daily'][:depth - 1] +
+                     ['amount'])
+
+
+def nest(value, depth):
+    """
+    Return (root key, value nested like path(depth)).
+    """
+    keys = path(depth).split('__')
+    for key in reversed(keys[1:]):
+        value = {key: value}
+    return keys[0], value
+
+
+def logic(conditions, depth, rnd):
+    """
+    Return a logic string over conditions 1..conditions, with up to depth
+    levels of nesting, i.e. '1 & (2 | ~(3 & 4))'.
+    """
+    expr = str(conditions)
+    for i in xrange(conditions - 1, 0, -1):
+        op = rnd.choice('&&|')
+        if ' ' in expr and conditions - i <= depth:
+            negate = '~' if rnd.random() < 0.2 else ''
+            expr = '{} {} {}({})'.format(i, op, negate, expr)
+        else:
+            expr = '{} {} {}'.format(i, op, expr)
+    return expr
+
+
+def make_rows(count, logic_depth=2, path_depth=1, seed=0):
+    """
+    Return count TableRule rows with logic_depth + 1 conditions each, one
+    of them on a value path_depth levels deep.
+    """
+    rnd = random.Random(seed)
+    rows = []
+    for i in xrange(count):
+        conditions = [
+            {'{}__{}'.format(path(path_depth), rnd.choice(OPS)):
+             rnd.randint(0, 1000)},
+            {'country': rnd.choice(COUNTRIES)}]
+        for j in xrange(logic_depth - 1):
+            conditions.append({'score__gt': rnd.randint(0, 100)})
+        rows.append({
+            'rule': 'row{}'.format(i),
+            'if': {'logic': logic(len(conditions), logic_depth, rnd),
+                   'conditions': conditions},
+            'then': ['context.score + {}'.format(i)],
+            'target': ['result']})
+    return rows
+
+
+def make_contexts(count, path_depth=1, seed=1):
+    """
+    Return count context dicts matching make_rows.
+    """
+    rnd = random.Random(seed)
+    contexts = []
+    for i in xrange(count):
+        root, value = nest(rnd.randint(0, 1000), path_depth)
+        contexts.append({
+            root: value,
+            'country': rnd.choice(COUNTRIES),
+            'score': rnd.randint(0, 100)})
+    return contexts
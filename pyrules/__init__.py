@@ -1,5 +1,44 @@
-from .dictobj import DictObject
-from .engine import RuleContext, RuleEngine
-from .language import Translator
-from .rules import TableRule, Rule, ConditionalRule, SequencedRuleset
-from .storage import RuleStore
\ No newline at end of file
+import importlib
+import sys
+from types import ModuleType
+
+
+# Public names by the module defining them. Modules are imported when one
+# of their names is first used, so 'import pyrules' doesn't load Django,
+# YAML or pyparsing.
+_exports = {
+    'DictObject': 'dictobj',
+    'RuleContext': 'engine',
+    'RuleEngine': 'engine',
+    'Translator': 'language',
+    'ParallelRuleEngine': 'parallel',
+    'TableRule': 'rules',
+    'Rule': 'rules',
+    'ConditionalRule': 'rules',
+    'SequencedRuleset': 'rules',
+    'RuleStore': 'storage',
+    'ExecutionTrace': 'trace',
+}
+
+
+class _LazyModule(ModuleType):
+    def __getattr__(self, name):
+        try:
+            module = _exports[name]
+        except KeyError:
+            raise AttributeError(
+                "'module' object has no attribute '{}'".format(name))
+        value = getattr(importlib.import_module('.' + module, __name__), name)
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(_exports))
+
+
+_lazy = _LazyModule(__name__, __doc__)
+_lazy.__dict__.update(sys.modules[__name__].__dict__)
+_lazy.__all__ = sorted(_exports)
+# Python 2 clears the globals of a module when it's collected, keep it
+_lazy._module = sys.modules[__name__]
+sys.modules[__name__] = _lazy
@@ -1,8 +1,17 @@
+import itertools
 import json
+from django.conf.urls import url
+from django.core.exceptions import ObjectDoesNotExist
+from django.http import StreamingHttpResponse
+from tastypie.exceptions import ImmediateHttpResponse
+from tastypie.http import HttpNotFound
 from tastypie.resources import Resource
+from tastypie.utils import trailing_slash
 from tpasync.resources import AsyncResourceMixin
 from .. import RuleEngine, RuleStore, RuleContext
+from ..batching import get_aggregator
 from ..tasks import execute_rule, execute_ruleset
+from ..tasks import execute_rule_batch, execute_ruleset_batch
 
 
 class RuleSyncResourceMixin(object):
@@ -21,7 +30,7 @@ class RuleSyncResourceMixin(object):
         context = RuleContext(json.loads(request.body))
         rule = RuleStore().get_rule(pk)
         data = {
-            'result': engine.execute([rule], context).to_dict(),
+            'result': engine.execute([rule], context).to_dict(copy=False),
             'resource_uri': '/api/{}/rule/{}/'.format(
                 kwargs['api_name'], pk)}
         bundle = self.build_bundle(data=data, obj=rule, request=request)
@@ -41,6 +50,9 @@ class RuleAsyncResourceMixin(AsyncResourceMixin):
 
     def async_post_detail(self, request, pk, **kwargs):
         context = json.loads(request.body)
+        aggregator = get_aggregator(execute_rule_batch)
+        if aggregator is not None:
+            return aggregator.add(pk, context)
         return execute_rule.apply_async([pk, context])
 
 
@@ -49,16 +61,164 @@ class RuleAsyncResource(RuleAsyncResourceMixin, Resource):
 
 
 class RulesetSyncResourceMixin(object):
+    """
+    Executes a ruleset for the posted context. Many contexts can be posted
+    to <name>/batch/ as a JSON array or as NDJSON (one JSON object per
+    line), results are streamed back as NDJSON in the same order, i.e.
+    {"result": {...}} or {"error": "..."} per context. Both formats are
+    read incrementally.
+    """
+    # Number of contexts executed at once by the batch view
+    BATCH_CHUNK = 100
+    # Bytes read at once from batch bodies
+    READ_SIZE = 64 * 1024
+
     class Meta:
         allowed_methods = ['post']
         resource_name = 'ruleset'
         include_resource_uri = False
 
+    def prepend_urls(self):
+        return [
+            url(r'^(?P<resource_name>{})/(?P<pk>[^/]+)/batch{}$'.format(
+                self._meta.resource_name, trailing_slash()),
+                self.wrap_view('post_batch'), name='api_ruleset_batch'),
+        ]
+
+    def post_batch(self, request, pk, **kwargs):
+        self.method_check(request, allowed=['post'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+        try:
+            ruleset = RuleStore().get_ruleset(pk)
+        except ObjectDoesNotExist:
+            raise ImmediateHttpResponse(response=HttpNotFound())
+        return StreamingHttpResponse(
+            self._execute_batch(ruleset, self._read_contexts(request)),
+            content_type='application/x-ndjson')
+
+    @classmethod
+    def _read_contexts(cls, request):
+        """
+        Yield contexts of a JSON array or NDJSON body, or exceptions for
+        lines that can't be parsed. The format is told from the first
+        READ_SIZE bytes, NDJSON is then read line by line.
+        """
+        text = ''
+        while not text:
+            chunk = request.read(cls.READ_SIZE)
+            if not chunk:
+                return
+            text = chunk.lstrip()
+        if text.startswith('['):
+            for context in cls._read_array(request, text):
+                yield context
+            return
+        if not text.endswith('\n'):
+            text += request.readline()
+        lines = itertools.chain(
+            text.splitlines(), iter(request.readline, ''))
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield e
+
+    @classmethod
+    def _read_array(cls, request, text):
+        """
+        Yield the items of the JSON array starting in text, reading the
+        rest of the body in READ_SIZE chunks. Yields an exception and stops
+        if the array is invalid.
+        """
+        decoder = json.JSONDecoder()
+        skip = json.decoder.WHITESPACE.match
+        buf = text
+        pos = text.index('[') + 1
+        eof = False
+        # Expecting the first item, or an item after ','
+        first = item = True
+        while True:
+            pos = skip(buf, pos).end()
+            error = ValueError('Incomplete JSON array')
+            if pos < len(buf):
+                char = buf[pos]
+                if char == ']' and (first or not item):
+                    rest = buf[pos + 1:]
+                    while not rest.strip():
+                        rest = request.read(cls.READ_SIZE)
+                        if not rest:
+                            return
+                    yield ValueError(
+                        'Extra data after JSON array: {!r}'.format(
+                            rest.strip()[:20]))
+                    return
+                if not item:
+                    if char != ',':
+                        yield ValueError('Expected "," or "]" at {!r}'.format(
+                            buf[pos:pos + 20]))
+                        return
+                    pos += 1
+                    item = True
+                    continue
+                try:
+                    context, end = decoder.raw_decode(buf, pos)
+                except ValueError as e:
+                    error = e
+                else:
+                    # Values at the end of the buffer may continue, i.e. 12|3
+                    if end < len(buf) or eof:
+                        yield context
+                        pos = end
+                        first = item = False
+                        continue
+            if eof:
+                yield error
+                return
+            chunk = request.read(cls.READ_SIZE)
+            eof = not chunk
+            buf = buf[pos:] + chunk
+            pos = 0
+
+    def _execute_batch(self, ruleset, contexts):
+        engine = RuleEngine()
+        while True:
+            chunk = list(itertools.islice(contexts, self.BATCH_CHUNK))
+            if not chunk:
+                return
+            valid = [
+                context for context in chunk if isinstance(context, dict)]
+            try:
+                results = iter(engine.execute_batch(ruleset, valid))
+            except Exception:
+                # Find the contexts that fail
+                results = None
+            for context in chunk:
+                if not isinstance(context, dict):
+                    data = {'error': 'Invalid context: {}'.format(context)}
+                elif results is not None:
+                    data = {'result': next(results).to_dict(copy=False)}
+                else:
+                    try:
+                        data = {'result': engine.execute(
+                            ruleset, RuleContext(context)).to_dict(
+                                copy=False)}
+                    except Exception as e:
+                        data = {'error': unicode(e)}
+                try:
+                    line = json.dumps(data)
+                except (TypeError, ValueError) as e:
+                    line = json.dumps({'error': unicode(e)})
+                yield line + '\n'
+
     def post_detail(self, request, pk, **kwargs):
         context = RuleContext(json.loads(request.body))
         ruleset = RuleStore().get_ruleset(pk)
         data = {
-            'result': RuleEngine().execute(ruleset, context).to_dict(),
+            'result': RuleEngine().execute(ruleset, context).to_dict(
+                copy=False),
             'resource_uri': '/api/{}/ruleset/{}/'.format(
                 kwargs['api_name'], pk)}
         bundle = self.build_bundle(data=data, request=request)
@@ -78,6 +238,9 @@ class RulesetAsyncResourceMixin(AsyncResourceMixin):
 
     def async_post_detail(self, request, pk, **kwargs):
         context = json.loads(request.body)
+        aggregator = get_aggregator(execute_ruleset_batch)
+        if aggregator is not None:
+            return aggregator.add(pk, context)
         return execute_ruleset.apply_async([pk, context])
 
 
@@ -0,0 +1,51 @@
+"""
+Precompiled TableRule artifacts. An artifact holds a pickled TableRule with
+its normalized rows, parsed logic and the code objects of its logic and
+actions, so loading it doesn't parse YAML/JSON or logic strings nor compile
+anything. Artifacts carry a format version, the bytecode version and a
+checksum of the source definition, stale artifacts are ignored.
+"""
+import cPickle as pickle
+import hashlib
+import imp
+
+
+# Increase when the pickled state of TableRule or LogicEvaluator changes.
+FORMAT_VERSION = 4
+# Marshalled code objects only load in the Python version they came from
+PYTHON_MAGIC = imp.get_magic()
+
+
+def checksum(definition, tablerule_format):
+    if isinstance(definition, unicode):
+        definition = definition.encode('utf-8')
+    return hashlib.sha1(
+        '{}:'.format(tablerule_format) + definition).hexdigest()
+
+
+def dumps(rule, definition, tablerule_format):
+    """
+    Return the artifact of a TableRule loaded from definition.
+    """
+    return pickle.dumps((
+        FORMAT_VERSION, PYTHON_MAGIC, checksum(definition, tablerule_format),
+        pickle.dumps(rule, pickle.HIGHEST_PROTOCOL)),
+        pickle.HIGHEST_PROTOCOL)
+
+
+def loads(data, definition, tablerule_format):
+    """
+    Return the TableRule of an artifact, or None if there is no artifact or
+    it's stale, i.e. of another format version or definition, or it can't
+    be loaded, i.e. because a pickled class was renamed.
+    """
+    if not data:
+        return None
+    try:
+        version, magic, digest, rule = pickle.loads(bytes(data))
+        if (version != FORMAT_VERSION or magic != PYTHON_MAGIC or
+                digest != checksum(definition, tablerule_format)):
+            return None
+        return pickle.loads(rule)
+    except Exception:
+        return None
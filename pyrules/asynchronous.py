@@ -0,0 +1,68 @@
+"""
+Concurrent I/O for rules. Rules declare lookups (see Rule.lookups), the
+AsyncRuleEngine runs the lookups of a ruleset concurrently in a thread pool
+shared by all engines, so many requests don't need a thread each.
+"""
+import threading
+from multiprocessing.pool import ThreadPool
+from .engine import RuleEngine
+
+
+POOL_SIZE = 10
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Return the thread pool shared by engines, started on first use.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPool(POOL_SIZE)
+        return _pool
+
+
+class AsyncRuleEngine(RuleEngine):
+    """
+    Rule engine running the lookups of a ruleset concurrently before the
+    rules are executed. Lookup results are stored in the context, keys that
+    are already set aren't looked up again. Errors raised by a lookup are
+    raised by execute.
+
+    @param pool: multiprocessing ThreadPool, defaults to the shared pool
+    @param timeout: seconds to wait for lookups, None to wait forever
+    """
+    def __init__(self, pool=None, timeout=None, **kwargs):
+        super(AsyncRuleEngine, self).__init__(**kwargs)
+        self.pool = pool
+        self.timeout = timeout
+
+    def fetch(self, ruleset, context):
+        """
+        Run the lookups of ruleset concurrently and store their results in
+        context.
+        """
+        lookups = {}
+        for rule in ruleset:
+            lookups.update(rule.lookups(context))
+        lookups = [
+            (key, lookup) for key, lookup in lookups.items()
+            if context[key] is None]
+        if not lookups:
+            return context
+        pool = self.pool or get_pool()
+        pending = [
+            (key, pool.apply_async(lookup, (context,)))
+            for key, lookup in lookups]
+        # Results are stored once all lookups are done, so lookups see the
+        # context as it was before
+        results = [(key, result.get(self.timeout)) for key, result in pending]
+        context.update(dict(results))
+        return context
+
+    def execute(self, ruleset, context, unsafe=True):
+        self.fetch(ruleset, context)
+        return super(AsyncRuleEngine, self).execute(ruleset, context, unsafe)
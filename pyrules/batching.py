@@ -0,0 +1,96 @@
+"""
+Producer side micro-batching of rule execution tasks.
+"""
+import atexit
+import threading
+from celery.utils import uuid
+from django.conf import settings
+
+
+# Aggregators by batch task name, see get_aggregator
+_aggregators = {}
+_aggregators_lock = threading.Lock()
+
+
+def get_aggregator(batch_task):
+    """
+    Return the process-wide BatchAggregator sending batch_task, configured
+    by the PYRULES_BATCH_SIZE and PYRULES_BATCH_WINDOW (seconds) settings.
+    Returns None if batching is disabled, which is the default.
+    """
+    size = getattr(settings, 'PYRULES_BATCH_SIZE', 0)
+    if not size:
+        return None
+    with _aggregators_lock:
+        try:
+            return _aggregators[batch_task.name]
+        except KeyError:
+            aggregator = _aggregators[batch_task.name] = BatchAggregator(
+                batch_task, size=size,
+                window=getattr(settings, 'PYRULES_BATCH_WINDOW', 0.05))
+            return aggregator
+
+
+class BatchAggregator(object):
+    """
+    Collects contexts for the same rule or ruleset and sends them as one
+    batch task, once size contexts are collected or window seconds after
+    the first one. Every caller gets an AsyncResult for its own context,
+    the batch task stores the results under these ids.
+
+    @param batch_task: task taking (name, contexts, task_ids), i.e.
+        pyrules.tasks.execute_rule_batch
+    """
+    def __init__(self, batch_task, size=50, window=0.05):
+        self.batch_task = batch_task
+        self.size = size
+        self.window = window
+        # (task id, context) by rule or ruleset name
+        self._pending = {}
+        self._timers = {}
+        self._lock = threading.Lock()
+        # Don't lose contexts waiting for the window when the process exits
+        atexit.register(self.flush)
+
+    def add(self, name, context):
+        """
+        Add a context for name, returns its AsyncResult.
+        """
+        task_id = uuid()
+        batch = None
+        with self._lock:
+            pending = self._pending.setdefault(name, [])
+            pending.append((task_id, context))
+            if len(pending) >= self.size:
+                batch = self._take(name)
+            elif name not in self._timers:
+                timer = threading.Timer(self.window, self.flush, [name])
+                timer.daemon = True
+                self._timers[name] = timer
+                timer.start()
+        if batch:
+            self._send(name, batch)
+        return self.batch_task.AsyncResult(task_id)
+
+    def flush(self, name=None):
+        """
+        Send the contexts collected for name, or for all names.
+        """
+        with self._lock:
+            names = [name] if name is not None else list(self._pending)
+            batches = [(key, self._take(key)) for key in names]
+        for key, batch in batches:
+            if batch:
+                self._send(key, batch)
+
+    def _take(self, name):
+        timer = self._timers.pop(name, None)
+        if timer is not None:
+            timer.cancel()
+        return self._pending.pop(name, None)
+
+    def _send(self, name, batch):
+        self.batch_task.apply_async([
+            name,
+            [context for _task_id, context in batch],
+            [task_id for task_id, _context in batch]])
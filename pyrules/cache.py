@@ -0,0 +1,63 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class RuleCache(object):
+    """
+    Process-local LRU cache of constructed rule objects. Entries carry the
+    version stamp they were loaded with and are only used while the stamp
+    is unchanged and they are younger than ttl seconds. Cached objects are
+    shared by all callers.
+
+    @param max_size: maximum number of entries
+    @param ttl: maximum age of entries in seconds, None for no limit
+    """
+    def __init__(self, max_size=128, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version, load):
+        """
+        Return the value cached for key if it was loaded with the same
+        version, else call load() and cache its result. Without a version,
+        values are only cached if there is a ttl.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                if entry[0] == version and (
+                        self.ttl is None or now - entry[2] < self.ttl):
+                    self._entries[key] = entry
+                    self.hits += 1
+                    return entry[1]
+                self.stale += 1
+            self.misses += 1
+        value = load()
+        if self.max_size and (version is not None or self.ttl is not None):
+            with self._lock:
+                self._entries[key] = (version, value, now)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, key=None):
+        """
+        Drop the entry for key, or all entries if no key is given.
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        return {
+            'hits': self.hits, 'misses': self.misses, 'stale': self.stale,
+            'size': len(self._entries)}
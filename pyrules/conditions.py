@@ -1,6 +1,9 @@
+import marshal
 import operator
-from pyparsing import Forward, Word, Literal, Suppress, Optional, Group, nums
-from pyparsing import infixNotation, opAssoc, ParseResults
+import re
+import threading
+import types
+from timeit import default_timer
 
 
 class C(object):
@@ -9,6 +12,8 @@ class C(object):
     XOR = 'XOR'
     default = AND
     OPS_MAP = {AND: operator.and_, OR: operator.or_, XOR: operator.xor}
+    # Python operators used when compiling, 'and'/'or' short-circuit.
+    SOURCE_OPS = {AND: 'and', OR: 'or', XOR: '^'}
 
     def __init__(self, _key=None, _value=None, _negate=False, **kwargs):
         if _key:
@@ -44,14 +49,64 @@ class C(object):
 
     def _apply_expr(self, context, expr):
         if isinstance(expr[1], tuple):
+            # expr[3] holds negation flag of the combined expression.
             return self.OPS_MAP[expr[0]](
                 self._apply_expr(context, expr[1]),
-                self._apply_expr(context, expr[2]))
+                self._apply_expr(context, expr[2])) ^ expr[3]
         else:
             # expr[2] holds negation flag, that's why we xor with it.
-            return ExpressionHandler().evaluate(
+            return expression_handler.evaluate(
                 expr[0], context, expr[1]) ^ expr[2]
 
+    def compile(self):
+        """
+        Compile this C-expression into a function taking the context. The
+        function short-circuits and/or, so it only evaluates the leaves it
+        needs, and returns the same result as apply().
+        """
+        namespace = {}
+        source = self._compile_expr(self._expr, namespace)
+        return eval('lambda context: ' + source, namespace)
+
+    def _compile_expr(self, expr, namespace, leaf=None):
+        """
+        Translate expr into Python source. Leaf callables and values are
+        added to namespace. leaf can be given to generate source for leaves
+        differently, it's called as leaf(expr, namespace).
+        """
+        if isinstance(expr[1], tuple):
+            source = '({} {} {})'.format(
+                self._compile_expr(expr[1], namespace, leaf),
+                self.SOURCE_OPS[expr[0]],
+                self._compile_expr(expr[2], namespace, leaf))
+        else:
+            source = (leaf or self._compile_leaf)(expr, namespace)
+        return '(not {})'.format(source) if expr[-1] else source
+
+    @staticmethod
+    def _compile_leaf(expr, namespace):
+        index = len(namespace)
+        namespace['_p{}'.format(index)] = expression_handler.path(expr[0])
+        namespace['_v{}'.format(index)] = expr[1]
+        return '_p{0}.evaluate(context, _v{0})'.format(index)
+
+    @staticmethod
+    def _compile_memo_leaf(expr, namespace):
+        """
+        Like _compile_leaf, but the result is looked up in a ConditionMemo
+        passed as 'memo'. Leaves with unhashable values aren't memoized.
+        """
+        key = (expr[0], expr[1])
+        try:
+            hash(key)
+        except TypeError:
+            return C._compile_leaf(expr, namespace)
+        index = len(namespace)
+        namespace['_k{}'.format(index)] = key
+        namespace['_p{}'.format(index)] = expression_handler.path(expr[0])
+        namespace['_v{}'.format(index)] = expr[1]
+        return 'memo.lookup(_k{0}, _p{0}, _v{0}, context)'.format(index)
+
     def __repr__(self):
         return '<C: {}>'.format(self._to_str(self._expr)).encode('utf-8')
 
@@ -89,38 +144,94 @@ class C(object):
 class ExpressionError(Exception):
     pass
 
+
+class ConditionMemo(object):
+    """
+    Memo of condition results shared by all evaluators during one execution.
+    Results are keyed on (expression, argument), negation is applied to the
+    memoized result. Entries are dropped when the context key they read is
+    written (see RuleContext), changes inside nested objects are not seen.
+    """
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._results = {}
+        self._keys = {}
+
+    def lookup(self, key, path, arg, context):
+        try:
+            result = self._results[key]
+        except KeyError:
+            self.misses += 1
+            result = self._results[key] = path.evaluate(context, arg)
+            self._keys.setdefault(path.root, []).append(key)
+            return result
+        self.hits += 1
+        return result
+
+    def invalidate(self, name):
+        """
+        Drop results of conditions reading the context key name.
+        """
+        for key in self._keys.pop(name, ()):
+            del self._results[key]
+
         
 class ExpressionHandler(object):
     handlers = [
         'gt', 'lt', 'gte', 'lte', 'eq', 'neq', 'contains', 'icontains', 'bool']
 
+    # How a bit resolves on a value, see mode()
+    PROBE, ITEM, NONE = range(3)
+    # Per-shape cache of resolution modes, keyed by (type of value, bit)
+    _modes = {}
+
+    def __init__(self):
+        self._paths = {}
+
     def evaluate(self, expression, context, arg):
-        bits = expression.split('__')
-        last = len(bits) - 2
-        bit = bits[0]
+        return self.path(expression).evaluate(context, arg)
+
+    def path(self, expression):
+        """
+        Return the pre-resolved ExpressionPath for an expression. Paths are
+        cached, so every expression is split only once.
+        """
         try:
-            cur = context[bit]
+            return self._paths[expression]
         except KeyError:
-            raise ExpressionError(
-                'Can\'t resolve "{}" bit in expression: "{}"'.format(
-                    bit, expression))
-        for i, bit in enumerate(bits[1:]):
-            try:
-                cur = getattr(cur, bit)
-                continue
-            except AttributeError:
-                try:
-                    cur = cur[bit]
-                    continue
-                except (TypeError, KeyError):
-                    if i == last and bit in self.handlers:
-                        return getattr(self, 'handle_' + bit)(cur, arg)
-                    raise ExpressionError(
-                        'Can\'t resolve "{}" bit in expression: "{}"'.format(
-                            bit, expression))
+            path = self._paths[expression] = ExpressionPath(expression, self)
+            return path
+
+    @classmethod
+    def mode(cls, value, bit):
+        """
+        Return how bit resolves on values of the same type as value:
+
+        PROBE - try attribute, then item access (instances may differ)
+        ITEM  - attribute access always fails, try item access only
+        NONE  - neither attribute nor item access can resolve the bit
+
+        The result only depends on the type, so it's cached per shape and
+        the exception-driven probing isn't repeated for every evaluation.
+        """
+        key = (type(value), bit)
+        try:
+            return cls._modes[key]
+        except KeyError:
+            pass
+        kind = type(value)
+        if (hasattr(value, '__dict__') or hasattr(kind, '__getattr__') or
+                hasattr(kind, bit)):
+            mode = cls.PROBE
+        elif (not hasattr(kind, '__getitem__') or
+                kind in (str, unicode, list, tuple)):
+            mode = cls.NONE
         else:
-            return cur == arg
-            
+            mode = cls.ITEM
+        cls._modes[key] = mode
+        return mode
+
     handle_gt = operator.gt
     handle_lt = operator.lt
     handle_gte = operator.ge
@@ -131,6 +242,91 @@ class ExpressionHandler(object):
     handle_icontains = lambda self, val, arg: arg.lower() in val.lower()
     handle_bool = lambda self, val, arg: bool(val) == arg
 
+
+def _path(expression):
+    return expression_handler.path(expression)
+
+
+class ExpressionPath(object):
+    """
+    An expression like 'user__age__gte', split once into its root key, the
+    bits to look up and the operator bound for the last bit.
+    """
+    def __init__(self, expression, handler):
+        self.expression = expression
+        bits = expression.split('__')
+        self.root = bits[0]
+        self.bits = bits[1:]
+        self.last = len(self.bits) - 1
+        self.operator = (
+            getattr(handler, 'handle_' + self.bits[-1])
+            if self.bits and self.bits[-1] in handler.handlers else None)
+
+    def __reduce__(self):
+        # Unpickled paths are the cached ones, see ExpressionHandler.path
+        return _path, (self.expression,)
+
+    def evaluate(self, context, arg):
+        try:
+            cur = context[self.root]
+        except KeyError:
+            raise self._error(self.root)
+        modes = ExpressionHandler._modes
+        for i, bit in enumerate(self.bits):
+            mode = modes.get((type(cur), bit))
+            if mode is None:
+                mode = ExpressionHandler.mode(cur, bit)
+            if mode == ExpressionHandler.PROBE:
+                try:
+                    cur = getattr(cur, bit)
+                    continue
+                except AttributeError:
+                    pass
+            if mode != ExpressionHandler.NONE:
+                try:
+                    cur = cur[bit]
+                    continue
+                except (TypeError, KeyError):
+                    pass
+            if i == self.last and self.operator:
+                return self.operator(cur, arg)
+            raise self._error(bit)
+        return cur == arg
+
+    def resolve(self, context):
+        """
+        Return the value the whole path points to, without applying any
+        operator.
+        """
+        try:
+            cur = context[self.root]
+        except KeyError:
+            raise self._error(self.root)
+        for bit in self.bits:
+            mode = ExpressionHandler.mode(cur, bit)
+            if mode == ExpressionHandler.PROBE:
+                try:
+                    cur = getattr(cur, bit)
+                    continue
+                except AttributeError:
+                    pass
+            if mode != ExpressionHandler.NONE:
+                try:
+                    cur = cur[bit]
+                    continue
+                except (TypeError, KeyError):
+                    pass
+            raise self._error(bit)
+        return cur
+
+    def _error(self, bit):
+        return ExpressionError(
+            'Can\'t resolve "{}" bit in expression: "{}"'.format(
+                bit, self.expression))
+
+
+expression_handler = ExpressionHandler()
+
             
 #
 # BNF grammar for parser:
@@ -155,6 +351,7 @@ def makeLRlike(numterms=None):
 
     Borrowed from http://stackoverflow.com/a/4589920
     """
+    from pyparsing import ParseResults
     if numterms is None:
         # None operator can only by binary op
         initlen = 2
@@ -176,41 +373,249 @@ def makeLRlike(numterms=None):
             return ParseResults([ret])
     return pa
 
-boolOperand = Word(nums)
+def build_grammar():
+    """
+    Build the pyparsing grammar for logic strings. pyparsing is imported
+    here, so it's only loaded when the grammar is used.
+    """
+    from pyparsing import Word, infixNotation, nums, opAssoc
+    boolOperand = Word(nums)
+
+    # define expression, based on expression operand and
+    # list of operations in precedence order
+    return infixNotation(
+        boolOperand,
+        [
+            ("~", 1, opAssoc.RIGHT, makeLRlike()),
+            ("&", 2, opAssoc.LEFT, makeLRlike(2)),
+            ("|",  2, opAssoc.LEFT, makeLRlike(2)),
+            ("^",  2, opAssoc.LEFT, makeLRlike(2))
+        ])
+
+
+class LazyGrammar(object):
+    """
+    Stands in for the grammar returned by factory, which is built on first
+    use.
+    """
+    def __init__(self, factory):
+        self._factory = factory
+        self._grammar = None
+
+    def __getattr__(self, name):
+        if self._grammar is None:
+            self._grammar = self._factory()
+        return getattr(self._grammar, name)
+
 
-# define expression, based on expression operand and
-# list of operations in precedence order
-boolExpr = infixNotation(
-    boolOperand,
-    [
-        ("~", 1, opAssoc.RIGHT, makeLRlike()),
-        ("&", 2, opAssoc.LEFT, makeLRlike(2)),
-        ("|",  2, opAssoc.LEFT, makeLRlike(2)),
-        ("^",  2, opAssoc.LEFT, makeLRlike(2))
-    ])
+boolExpr = LazyGrammar(build_grammar)
+
+
+_LOGIC_TOKEN = re.compile(r'\s*(?:(\d+)|([~&|^()]))')
+# Binary operators by precedence, all left associative. ~ binds tightest.
+_LOGIC_PRECEDENCE = {'&': 3, '|': 2, '^': 1}
+
+
+class _LogicSyntaxError(Exception):
+    pass
+
+
+def parse_logic_tree(logic):
+    """
+    Parse a logic string into the tree boolExpr.parseString would return,
+    i.e. '~1 & 2' -> [['~', '1'], '&', '2']. Precedence climbing parser,
+    much faster than pyparsing. Returns None if logic isn't one complete,
+    valid expression.
+    """
+    tokens = []
+    pos = 0
+    end = len(logic.rstrip())
+    while pos < end:
+        match = _LOGIC_TOKEN.match(logic, pos)
+        if match is None:
+            return None
+        tokens.append(match.group(1) or match.group(2))
+        pos = match.end()
+    tokens.append(None)
+    position = [0]
+
+    def take():
+        token = tokens[position[0]]
+        if token is None:
+            raise _LogicSyntaxError()
+        position[0] += 1
+        return token
+
+    def operand():
+        token = take()
+        if token == '~':
+            return ['~', operand()]
+        elif token == '(':
+            tree = expression(1)
+            if take() != ')':
+                raise _LogicSyntaxError()
+            return tree
+        elif token.isdigit():
+            return token
+        raise _LogicSyntaxError()
+
+    def expression(precedence):
+        tree = operand()
+        while _LOGIC_PRECEDENCE.get(tokens[position[0]], 0) >= precedence:
+            op = take()
+            tree = [tree, op, expression(_LOGIC_PRECEDENCE[op] + 1)]
+        return tree
+
+    try:
+        tree = expression(1)
+    except _LogicSyntaxError:
+        return None
+    if tokens[position[0]] is not None:
+        return None
+    return tree
+
+
+def _condition_result(result):
+    if isinstance(result, Exception):
+        raise result
+    return result
 
 
 class LogicEvaluator(object):
+    """
+    Evaluates the logic of a TableRule row over its conditions.
+
+    With adaptive=True, every condition is evaluated on its own on the
+    first SAMPLE_SIZE evaluations and then on one in SAMPLE_EVERY, to
+    measure how often it's true and how long it takes. After every
+    SAMPLE_SIZE samples, &/| chains are reordered so cheap conditions that
+    likely decide the chain come first, see reorder. Conditions may only
+    work if others are checked first, i.e. '1 & 2' where 2 raises unless 1
+    is true. If the reordered logic raises, the context is evaluated with
+    the original logic, the raising conditions are marked unsafe and the
+    original order is restored. Chains with unsafe conditions aren't
+    reordered again.
+    """
     LOGIC_OPS = {'&': operator.and_, '|': operator.or_, '^': operator.xor}
     _force_conditions = None
+    # If True, logic is also parsed with pyparsing, to check the results
+    validate_logic = False
+    # Parsed expressions by logic string, shared by all evaluators
+    _parsed = {}
+    PARSED_SIZE = 1024
+    SAMPLE_SIZE = 100
+    SAMPLE_EVERY = 100
     
-    def __init__(self, logic, conditions):
-        self.logic = self.parse_logic(
+    def __init__(self, logic, conditions, adaptive=False):
+        logic = self.parse_logic(
             logic or
             ' & '.join(
                 map(str, xrange(1, len(conditions) + 1))))
         if isinstance(conditions[0], bool):
             self._force_conditions = conditions[0]
+            self._compiled = logic, None, None
         else :
             self.logic_context = dict(
                 ('cond' + str(i + 1),
                  (C(**condition) if isinstance(condition, dict) else
                   C(**{condition: True})))
                 for i, condition in enumerate(conditions))
+            self._compiled = logic, self.compile(logic=logic), None
+        self._setup_sampling(adaptive)
+
+    def _setup_sampling(self, adaptive):
+        self.adaptive = adaptive and self._force_conditions is None
+        # Logic as written and its functions, reorder starts from it
+        self._original = self.logic
+        self._original_compiled = self._compiled
+        # Guards statistics and reordering, evaluators are shared by
+        # threads (see RuleStore)
+        self._lock = threading.Lock()
+        # [true, evaluated, seconds] by condition name
+        self.stats = {}
+        # Conditions that raised while sampling or in reordered logic
+        self._unsafe = set()
+        self._calls = 0
+        self._samples = 0
+        self._sampled = None
+        self._evaluate_results = None
+
+    @property
+    def logic(self):
+        """
+        The logic evaluated, a C expression. Reordered if adaptive.
+        """
+        return self._compiled[0]
+
+    def __getstate__(self):
+        # The parsed expressions and the code of the compiled logic are
+        # pickled, so unpickling doesn't parse or compile the logic again
+        state = {
+            'logic': self._original._expr, 'force': self._force_conditions}
+        if self._force_conditions is None:
+            state['conditions'] = dict(
+                (key, condition._expr)
+                for key, condition in self.logic_context.iteritems())
+            logic, evaluate, _evaluate_memo = self._compiled
+            if logic is self._original:
+                state['code'] = marshal.dumps(evaluate.func_code)
+                state['namespace'] = dict(
+                    (key, value)
+                    for key, value in evaluate.func_globals.iteritems()
+                    if key != '__builtins__')
+        if self.adaptive:
+            state['adaptive'] = self.get_stats()
+        return state
+
+    def __setstate__(self, state):
+        logic = C()
+        logic._expr = state['logic']
+        if state['force'] is not None:
+            self._force_conditions = state['force']
+            self._compiled = logic, None, None
+        else:
+            self.logic_context = {}
+            for key, expr in state['conditions'].iteritems():
+                condition = self.logic_context[key] = C()
+                condition._expr = expr
+            if 'code' in state:
+                evaluate = types.FunctionType(
+                    marshal.loads(state['code']), state['namespace'])
+            else:
+                evaluate = self.compile(logic=logic)
+            self._compiled = logic, evaluate, None
+        self._setup_sampling('adaptive' in state)
+        if self.adaptive:
+            self.set_stats(state['adaptive'])
 
     def parse_logic(self, logic):
-        tree = boolExpr.parseString(logic)[0]
-        return LogicEvaluator.to_c_expression(tree)
+        """
+        Parse logic into a C expression. Strings the fast parser doesn't
+        accept are parsed by pyparsing, which raises ParseException for
+        invalid logic.
+        """
+        try:
+            expr = self._parsed[logic]
+        except KeyError:
+            tree = parse_logic_tree(logic)
+            if tree is None:
+                tree = boolExpr.parseString(logic)[0]
+            elif self.validate_logic:
+                from pyparsing import ParseResults
+                expected = boolExpr.parseString(logic)[0]
+                if isinstance(expected, ParseResults):
+                    expected = expected.asList()
+                if tree != expected:
+                    raise ValueError(
+                        'Logic {!r} parsed as {}, expected {}'.format(
+                            logic, tree, expected))
+            expr = LogicEvaluator.to_c_expression(tree)._expr
+            if len(self._parsed) >= self.PARSED_SIZE:
+                self._parsed.clear()
+            self._parsed[logic] = expr
+        result = C()
+        result._expr = expr
+        return result
 
     @classmethod
     def to_c_expression(cls, tree):
@@ -222,17 +627,288 @@ class LogicEvaluator(object):
             return cls.LOGIC_OPS[tree[1]](
                 cls.to_c_expression(tree[0]), cls.to_c_expression(tree[2]))
 
-    def evaluate(self, context):
+    def compile(self, memoized=False, logic=None):
+        """
+        Compile logic and conditions into one function taking the context.
+        Logic leaves (i.e. 'cond1') are replaced by the source of their
+        conditions, so conditions are only evaluated as far as and/or need
+        them.
+
+        If memoized is True, the function takes the context and a
+        ConditionMemo to look condition results up in.
+
+        @param logic: C expression to compile instead of the current logic
+        """
+        if logic is None:
+            logic = self.logic
+        condition_leaf = C._compile_memo_leaf if memoized else None
+
+        def leaf(expr, namespace):
+            # Logic leaves always test a condition against True
+            condition = self.logic_context[expr[0]]
+            return condition._compile_expr(
+                condition._expr, namespace, condition_leaf)
+
+        namespace = {}
+        source = logic._compile_expr(logic._expr, namespace, leaf)
+        args = 'context, memo' if memoized else 'context'
+        return eval('lambda {}: {}'.format(args, source), namespace)
+
+    def evaluate(self, context, memo=None):
         """
         Evaluate logic conditions for given context
+
+        @param memo: optional ConditionMemo shared with other evaluators
+        """
+        if self._force_conditions is not None:
+            return self._force_conditions
+        if self.adaptive:
+            return self._evaluate_adaptive(context, memo)
+        if memo is None:
+            return self._compiled[1](context)
+        return self._evaluate_logic(self._compiled, context, memo)
+
+    def _evaluate_adaptive(self, context, memo):
+        self._sample(context)
+        # Logic and functions are replaced together, read them once
+        compiled = self._compiled
+        try:
+            return self._evaluate_logic(compiled, context, memo)
+        except Exception:
+            if compiled[0] is self._original:
+                raise
+        # The reordered logic evaluated a condition its guard would have
+        # skipped
+        unsafe = set()
+        for name, condition in self._compiled_conditions():
+            try:
+                condition(context)
+            except Exception:
+                unsafe.add(name)
+        with self._lock:
+            self._unsafe |= unsafe
+            self._set_logic(self._original)
+            compiled = self._compiled
+        return self._evaluate_logic(compiled, context, memo)
+
+    def _evaluate_logic(self, compiled, context, memo):
+        """
+        Evaluate the (logic, function, memoized function) tuple compiled.
+        """
+        logic, evaluate, evaluate_memo = compiled
+        if memo is None:
+            return evaluate(context)
+        if evaluate_memo is None:
+            evaluate_memo = self.compile(memoized=True, logic=logic)
+            with self._lock:
+                if compiled is self._original_compiled:
+                    self._original_compiled = logic, evaluate, evaluate_memo
+                if self._compiled is compiled:
+                    self._compiled = logic, evaluate, evaluate_memo
+        return evaluate_memo(context, memo)
+
+    def evaluate_results(self, results):
+        """
+        Evaluate the logic as written for the results of its conditions by
+        name, i.e. {'cond1': True}. Results that are exceptions are raised
+        if the logic needs them.
         """
         if self._force_conditions is not None:
             return self._force_conditions
+        if self._evaluate_results is None:
+            def leaf(expr, namespace):
+                return '_result(results[{!r}])'.format(expr[0])
+
+            namespace = {'_result': _condition_result}
+            source = self._original._compile_expr(
+                self._original._expr, namespace, leaf)
+            self._evaluate_results = eval(
+                'lambda results: ' + source, namespace)
+        return self._evaluate_results(results)
+
+    def fold(self, leaf, combine, negate):
+        """
+        Reduce the logic to one value, with logic leaves (i.e. 'cond1')
+        replaced by the expressions of their conditions.
+
+        @param leaf: called with (expression, value) of condition leaves
+        @param combine: called with (operator, left, right) for &, | and ^
+        @param negate: called with the value of negated nodes
+        """
+        def walk(expr, conditions):
+            if isinstance(expr[1], tuple):
+                value = combine(
+                    expr[0], walk(expr[1], conditions),
+                    walk(expr[2], conditions))
+            elif conditions is not None:
+                value = walk(conditions[expr[0]]._expr, None)
+            else:
+                value = leaf(expr[0], expr[1])
+            return negate(value) if expr[-1] else value
+
+        return walk(self.logic._expr, self.logic_context)
+
+    def _compiled_conditions(self):
+        if self._sampled is None:
+            self._sampled = [
+                (name, condition.compile())
+                for name, condition in sorted(self.logic_context.items())]
+        return self._sampled
+
+    def _set_logic(self, logic):
+        """
+        Replace the logic and its compiled functions in one assignment, so
+        threads never see the logic of one and the function of another.
+        Called with the lock held.
+        """
+        if logic is self._original:
+            self._compiled = self._original_compiled
+        elif logic is not self.logic:
+            self._compiled = logic, self.compile(logic=logic), None
+
+    def _sample(self, context):
+        with self._lock:
+            self._calls += 1
+            if (self._samples >= self.SAMPLE_SIZE and
+                    self._calls % self.SAMPLE_EVERY):
+                return
+        sampled = []
+        unsafe = set()
+        for name, condition in self._compiled_conditions():
+            start = default_timer()
+            try:
+                true = condition(context)
+            except Exception:
+                unsafe.add(name)
+                continue
+            sampled.append((name, true, default_timer() - start))
+        with self._lock:
+            self._unsafe |= unsafe
+            for name, true, elapsed in sampled:
+                stats = self.stats.setdefault(name, [0, 0, 0.0])
+                stats[0] += bool(true)
+                stats[1] += 1
+                stats[2] += elapsed
+            self._samples += 1
+            if self._samples % self.SAMPLE_SIZE == 0:
+                self._reorder()
+
+    def get_stats(self):
+        """
+        Return the sampled statistics as a JSON serializable dict.
+        """
+        with self._lock:
+            return {
+                'conditions': dict(
+                    (name, list(counts))
+                    for name, counts in self.stats.iteritems()),
+                'unsafe': sorted(self._unsafe)}
+
+    def set_stats(self, stats):
+        """
+        Load statistics returned by get_stats and reorder the logic by
+        them. Statistics of unknown conditions are ignored.
+        """
+        if self._force_conditions is not None:
+            return
+        with self._lock:
+            self.stats = dict(
+                (name, list(counts))
+                for name, counts in stats.get('conditions', {}).iteritems()
+                if name in self.logic_context)
+            self._unsafe = (
+                set(stats.get('unsafe', ())) & set(self.logic_context))
+            self._reorder()
 
-        # First, we evaluate logic context conditions in given context. This
-        # gives us the logic context.
-        logic_context = dict(
-            (key, value.apply(context))
-            for key, value in self.logic_context.iteritems())
-        # Next, we evaluate logic conditions in this logic context.
-        return self.logic.apply(logic_context)
+    def reorder(self):
+        """
+        Reorder the operands of &/| chains by the sampled statistics and
+        recompile the logic. Operands of a & chain are ordered by expected
+        cost over the probability of being false, so the chain stops as
+        early and cheaply as possible, operands of a | chain by cost over
+        the probability of being true. Chains with an operand without
+        statistics or an unsafe operand keep their original order. Returns
+        True if the order changed.
+        """
+        if self._force_conditions is not None:
+            return False
+        with self._lock:
+            return self._reorder()
+
+    def _reorder(self):
+        expr = self._reorder_expr(self._original._expr)[0]
+        if expr == self.logic._expr:
+            return False
+        if expr == self._original._expr:
+            self._set_logic(self._original)
+        else:
+            logic = C()
+            logic._expr = expr
+            self._set_logic(logic)
+        return True
+
+    def _reorder_expr(self, expr):
+        """
+        Return (reordered expr, expected cost, probability of being true),
+        cost and probability are None if they are unknown.
+        """
+        if not isinstance(expr[1], tuple):
+            counts = self.stats.get(expr[0])
+            if not counts or not counts[1] or expr[0] in self._unsafe:
+                return expr, None, None
+            true = float(counts[0]) / counts[1]
+            return expr, counts[2] / counts[1], 1 - true if expr[2] else true
+        op = expr[0]
+        operands = []
+        self._flatten(expr, op, operands)
+        original = operands
+        operands = [self._reorder_expr(operand) for operand in operands]
+        known = all(cost is not None for _expr, cost, _true in operands)
+        if known and op != C.XOR:
+            operands.sort(key=lambda operand: self._rank(op, *operand[1:]))
+        if [operand[0] for operand in operands] == original:
+            result = expr
+        else:
+            result = operands[0][0]
+            for operand in operands[1:]:
+                result = (op, result, operand[0], False)
+            result = result[:-1] + (expr[3],)
+        if not known:
+            return result, None, None
+        # Expected cost and probability, assuming independent conditions
+        cost = 0.0
+        reached = 1.0
+        for _expr, operand_cost, operand_true in operands:
+            cost += reached * operand_cost
+            if op == C.AND:
+                reached *= operand_true
+            elif op == C.OR:
+                reached *= 1 - operand_true
+        if op == C.AND:
+            true = reached
+        elif op == C.OR:
+            true = 1 - reached
+        else:
+            first, second = operands[0][2], operands[1][2]
+            true = first * (1 - second) + second * (1 - first)
+        return result, cost, 1 - true if expr[3] else true
+
+    @staticmethod
+    def _rank(op, cost, true):
+        # Cost over the probability that the operand decides the chain
+        decides = 1 - true if op == C.AND else true
+        return cost / decides if decides > 0 else float('inf')
+
+    @staticmethod
+    def _flatten(expr, op, operands):
+        """
+        Collect the operands of the chain of op starting at expr, i.e. the
+        operands of ((1 & 2) & 3) are 1, 2 and 3. Negated operations are
+        operands. ^ isn't flattened.
+        """
+        for operand in (expr[1], expr[2]):
+            if (op != C.XOR and isinstance(operand[1], tuple) and
+                    operand[0] == op and not operand[3]):
+                LogicEvaluator._flatten(operand, op, operands)
+            else:
+                operands.append(operand)
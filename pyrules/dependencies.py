@@ -0,0 +1,161 @@
+"""
+Static analysis of the context keys rules read and write, and the
+dependencies between rules of a ruleset that follow from it.
+"""
+import ast
+from .conditions import expression_handler
+from .engine import RuleContext
+from .rules import SequencedRuleset, TableRule
+
+
+def condition_keys(evaluator):
+    """
+    Return the set of context keys the conditions of evaluator look up.
+    """
+    if evaluator._force_conditions is not None:
+        return set()
+    return evaluator.fold(
+        lambda expression, value: set(
+            [expression_handler.path(expression).root]),
+        lambda op, left, right: left | right,
+        lambda keys: keys)
+
+
+def action_keys(action):
+    """
+    Return the set of context keys a table action reads, i.e. 'x' for
+    'context.x' or 'context["x"]'. Returns None if the action uses the
+    context otherwise, i.e. passes it to a function, calls one of its
+    values or methods (context.to_dict(), context.update(...)).
+    """
+    if not isinstance(action, basestring):
+        return set()
+    keys = set()
+    handled = set()
+    tree = ast.parse(action.strip(), mode='eval')
+    for node in ast.walk(tree):
+        if (isinstance(node, ast.Call) and
+                _is_context(getattr(node.func, 'value', None))):
+            return None
+        if not _is_context(getattr(node, 'value', None)):
+            continue
+        if isinstance(node, ast.Attribute):
+            if hasattr(RuleContext, node.attr):
+                # Methods and properties, i.e. context.as_dict
+                return None
+            keys.add(node.attr)
+        elif (isinstance(node, ast.Subscript) and
+                isinstance(node.slice, ast.Index) and
+                isinstance(node.slice.value, ast.Str)):
+            keys.add(node.slice.value.s)
+        else:
+            continue
+        handled.add(node.value)
+    if any(key[:1] == '_' for key in keys):
+        # The context's own attributes, i.e. context._executed
+        return None
+    for node in ast.walk(tree):
+        if _is_context(node) and node not in handled:
+            return None
+    return keys
+
+
+def _is_context(node):
+    return isinstance(node, ast.Name) and node.id == 'context'
+
+
+def rule_keys(rule):
+    """
+    Return (reads, writes), the sets of context keys rule reads and writes.
+    Both are None if the rule can't be analysed, i.e. for rules with Python
+    conditions and actions.
+    """
+    if isinstance(rule, TableRule):
+        reads = set()
+        writes = set()
+        for evaluator, row in zip(rule._evaluators, rule.rules):
+            reads |= condition_keys(evaluator)
+            for action, target in zip(row['then'], row['target']):
+                keys = action_keys(action)
+                if keys is None:
+                    return None, None
+                reads |= keys
+                writes.add(target.replace('context.', '').strip())
+        return reads, writes
+    elif isinstance(rule, SequencedRuleset):
+        reads = set()
+        writes = set()
+        for child in rule.rules:
+            child_reads, child_writes = rule_keys(child)
+            if child_reads is None:
+                return None, None
+            reads |= child_reads
+            writes |= child_writes
+        return reads, writes
+    return None, None
+
+
+class DependencyGraph(object):
+    """
+    Dependencies between the rules of a ruleset. Rule j depends on an
+    earlier rule i if one writes a key the other reads or writes. Rules
+    that can't be analysed depend on all earlier rules, and all later rules
+    depend on them.
+
+    Executing rules in an order that respects the dependencies, i.e. level
+    by level, gives the same context as executing them in sequence. Rules
+    of one level can run in any order or concurrently. SequencedRuleset
+    uses affected to skip rules, see skip_unchanged.
+    """
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.keys = [rule_keys(rule) for rule in self.rules]
+        # Keys read or written by the rules that can be analysed
+        self.known_keys = set()
+        for reads, writes in self.keys:
+            if reads is not None:
+                self.known_keys |= reads | writes
+        self.depends = [set() for rule in self.rules]
+        for j, (reads, writes) in enumerate(self.keys):
+            for i in xrange(j):
+                if self._conflict(self.keys[i], (reads, writes)):
+                    self.depends[j].add(i)
+
+    @staticmethod
+    def _conflict(first, second):
+        if first[0] is None or second[0] is None:
+            return True
+        return bool(
+            first[1] & second[0] or first[0] & second[1] or
+            first[1] & second[1])
+
+    def levels(self):
+        """
+        Return lists of rule indexes, every rule only depends on rules of
+        previous lists.
+        """
+        level = []
+        for j in xrange(len(self.rules)):
+            level.append(
+                max([level[i] + 1 for i in self.depends[j]] or [0]))
+        levels = [[] for _i in xrange(max(level) + 1 if level else 0)]
+        for j, n in enumerate(level):
+            levels[n].append(j)
+        return levels
+
+    def affected(self, keys):
+        """
+        Return sorted indexes of the rules that have to be executed again
+        if the given context keys change, because they read or write them
+        directly or through other rules.
+        """
+        keys = set(keys)
+        affected = []
+        for j, (reads, writes) in enumerate(self.keys):
+            if reads is None or reads & keys or writes & keys:
+                affected.append(j)
+                if writes is None:
+                    # Anything may change from here on
+                    return affected + range(j + 1, len(self.rules))
+                keys |= writes
+        return affected
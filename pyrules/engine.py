@@ -1,4 +1,6 @@
+from pyrules.conditions import ConditionMemo
 from pyrules.dictobj import DictObject
+from pyrules.trace import ExecutionTrace
 
 
 class RuleContext(DictObject):
@@ -8,37 +10,126 @@ class RuleContext(DictObject):
     The rule context is used to pass in attribute values that
     for the rules to consider. A rule does not have access to
     any other data except provided in this rule context. 
+
+    Values can be read and written as attributes or items, missing values
+    are None. Names starting with '_' aren't values but attributes of the
+    context, like for DictObject: RuleContext({'_x': 1}) sets context._x,
+    and item access raises KeyError for them. The context's own attributes
+    are slots, others are kept in the instance's __dict__.
     """
+    __slots__ = (
+        '_data', '_owned', '_executed', '_memo', '_state', '_profiler')
+
     def __init__(self, initial=None):
-        super(RuleContext, self).__init__(initial=initial)
-        self._executed = []
+        setattr_ = object.__setattr__
+        setattr_(self, '_data', {})
+        # False while _data is shared with a fork, see fork()
+        setattr_(self, '_owned', True)
+        setattr_(self, '_executed', ExecutionTrace())
+        # ConditionMemo shared by the rules evaluated in this context
+        setattr_(self, '_memo', None)
+        # Rules' own state for this context, see SequencedRuleset
+        setattr_(self, '_state', None)
+        # Profiler timing the rules, see pyrules.profiling
+        setattr_(self, '_profiler', None)
+        if initial:
+            self.update(initial)
 
-    def __setitem__(self, item, value):
-        self.__setattr__(item, value)
+    def __getattr__(self, name):
+        # Only called for names that aren't set attributes or methods
+        if name[:2] == '__':
+            raise AttributeError(name)
+        return self._data.get(name)
+
+    def __setattr__(self, name, value):
+        if name[:1] == '_':
+            object.__setattr__(self, name, value)
+            return
+        if not self._owned:
+            self._own()
+        self._data[name] = value
+        if self._memo is not None:
+            self._memo.invalidate(name)
 
     def __getitem__(self, item):
-        if item.startswith('_'):
+        if item[:1] == '_':
             raise KeyError('Key {} not found'.format(item))
-        else:
-            try:
-                return self.__getattr__(item)
-            except AttributeError:
-                raise KeyError('Key {} not found'.format(item))
-                
+        return self._data.get(item)
+
+    def __setitem__(self, item, value):
+        if item[:1] == '_':
+            object.__setattr__(self, item, value)
+            return
+        if not self._owned:
+            self._own()
+        self._data[item] = value
+        if self._memo is not None:
+            self._memo.invalidate(item)
+
+    def update(self, other):
+        if not self._owned:
+            self._own()
+        data = self._data
+        memo = self._memo
+        for k in other:
+            if k[:1] == '_':
+                object.__setattr__(self, k, other[k])
+                continue
+            data[k] = other[k]
+            if memo is not None:
+                memo.invalidate(k)
+
+    def _own(self):
+        """
+        Copy data shared with a fork before it's written to.
+        """
+        object.__setattr__(self, '_data', dict(self._data))
+        object.__setattr__(self, '_owned', True)
+
+    def fork(self):
+        """
+        Return a new context with the same values, i.e. for what-if
+        evaluation. Values are shared until either context is written to,
+        so forking costs O(1). The fork starts with an empty trace of the
+        same level and size.
+        """
+        new = RuleContext()
+        trace = self._executed
+        object.__setattr__(
+            new, '_executed', ExecutionTrace(trace.level, trace.size))
+        object.__setattr__(new, '_profiler', self._profiler)
+        object.__setattr__(new, '_data', self._data)
+        object.__setattr__(new, '_owned', False)
+        object.__setattr__(self, '_owned', False)
+        return new
+
+    def __getstate__(self):
+        return self._data, self._executed, self.__dict__
+
+    def __setstate__(self, state):
+        self.__init__()
+        object.__setattr__(self, '_data', state[0])
+        object.__setattr__(self, '_executed', state[1])
+        self.__dict__.update(state[2])
+
     @property
     def as_dict(self):
         return {'context' : self}
 
-    def to_dict(self):
-        # Return copy of context data to prevent later modification by
-        # caller
-        return dict(self._data)
+    def to_dict(self, copy=True):
+        """
+        Return context data. By default, this is a copy to prevent later
+        modification by caller. With copy=False the data itself is
+        returned, which must not be modified.
+        """
+        return dict(self._data) if copy else self._data
 
     def __unicode__(self):
-        return unicode(self.to_dict())
+        return unicode(self.to_dict(copy=False))
 
     def __repr__(self):
-        return u'<RuleContext: {}>'.format(self.to_dict()).encode('utf-8')
+        return u'<RuleContext: {}>'.format(
+            self.to_dict(copy=False)).encode('utf-8')
 
 
 class RuleEngine(object):
@@ -48,15 +139,70 @@ class RuleEngine(object):
     1. call each rules should_trigger method 
     2. if True, call the rule's perform method to evaluate it
     3. then call the rule's record method, to record the evaluation's result
+
+    With memoize=True, condition results are shared by all rules and rows
+    evaluated in a context (see ConditionMemo), the memo is available as
+    context._memo afterwards.
+
+    @param trace: level of the trace kept in context._executed, one of
+        ExecutionTrace.OFF, COUNTS, IDS or FULL
+    @param trace_size: number of trace entries kept, None for all
+    @param profiler: pyrules.profiling.Profiler to time rules with
     """
+    def __init__(self, memoize=False, trace=ExecutionTrace.FULL,
+                 trace_size=None, profiler=None):
+        self.memoize = memoize
+        self.trace = trace
+        self.trace_size = trace_size
+        self.profiler = profiler
+
+    def prepare(self, context):
+        """
+        Set up memo, trace and profiler of a context as configured. A trace
+        that already has entries is kept.
+        """
+        if self.memoize and context._memo is None:
+            context._memo = ConditionMemo()
+        trace = context._executed
+        if not trace.total and (trace.level, trace.size) != (
+                self.trace, self.trace_size):
+            context._executed = ExecutionTrace(self.trace, self.trace_size)
+        if self.profiler is not None:
+            context._profiler = self.profiler
+
     def execute(self, ruleset, context, unsafe=True):
         """
         Execute ruleset in given context
         
         @param unsafe: enable unsafe evaluation using eval
         """
+        self.prepare(context)
+        profiler = context._profiler
         for rule in ruleset:
-            if rule.should_trigger(context):
+            if profiler is not None:
+                profiler.run(rule, context)
+            elif rule.should_trigger(context):
                 result = rule.perform(context)
                 rule.record(context, result)
         return context
+
+    def session(self, ruleset, initial=None):
+        """
+        Execute ruleset for initial values, returns a RuleSession to execute
+        it again incrementally as values change (see pyrules.session).
+        """
+        from pyrules.session import RuleSession
+        return RuleSession(self, ruleset, initial)
+
+    def execute_batch(self, ruleset, records):
+        """
+        Execute ruleset for each of the records (dicts), returns a list of
+        RuleContext. TableRule conditions are evaluated on NumPy columns if
+        NumPy is installed (see pyrules.vectorize), the results are the same
+        as calling execute for every record.
+        """
+        from pyrules.vectorize import BatchExecutor
+        contexts = [RuleContext(record) for record in records]
+        for context in contexts:
+            self.prepare(context)
+        return BatchExecutor(self).execute(ruleset, contexts)
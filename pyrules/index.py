@@ -0,0 +1,164 @@
+import bisect
+from .conditions import C, ExpressionError, ExpressionHandler
+from .conditions import expression_handler
+
+
+RANGE_OPS = ('gt', 'gte', 'lt', 'lte')
+
+
+def required_leaves(evaluator):
+    """
+    Return (expression, value) of the condition leaves that must hold for
+    the evaluator to return True, i.e. leaves that are only combined by
+    AND and not negated.
+    """
+    if evaluator._force_conditions is not None:
+        return []
+    return evaluator.fold(
+        lambda expression, value: [(expression, value)],
+        lambda op, left, right: left + right if op == C.AND else [],
+        lambda leaves: [])
+
+
+def split_expression(expression):
+    """
+    Split an expression into (field, operator) if it's an equality or range
+    test that can be indexed, i.e. 'foo__gt' -> ('foo', 'gt') or
+    'foo' -> ('foo', None). Returns None otherwise.
+    """
+    field, _sep, op = expression.rpartition('__')
+    if not field:
+        return expression, None
+    elif op == 'eq' or op in RANGE_OPS:
+        return field, op
+    elif op in ExpressionHandler.handlers:
+        return None
+    return expression, None
+
+
+class IndexFilter(object):
+    """
+    Base class for filters over one (field, operator) combination. Rows
+    without a requirement on it are free and always candidates.
+    """
+    def __init__(self, field, op, size, entries):
+        self.path = expression_handler.path(field)
+        self.op = op
+        self.free = set(xrange(size)) - set(row for row, _v in entries)
+
+    def value(self, context):
+        """
+        Return (True, value) of the field in context, or (False, None) if
+        the field or operator can't be resolved as the index expects. The
+        full evaluator takes care of these.
+        """
+        try:
+            value = self.path.resolve(context)
+        except ExpressionError:
+            return False, None
+        if self.op and (
+                ExpressionHandler.mode(value, self.op) !=
+                ExpressionHandler.NONE):
+            # The operator bit resolves as attribute or item of the value
+            return False, None
+        return True, value
+
+
+class EqualityFilter(IndexFilter):
+    """
+    Hash index over equality tests of a field against constants.
+    """
+    def __init__(self, field, op, size, entries):
+        self.buckets = {}
+        hashable = []
+        for row, value in entries:
+            try:
+                self.buckets.setdefault(value, set()).add(row)
+            except TypeError:
+                continue
+            hashable.append((row, value))
+        super(EqualityFilter, self).__init__(field, op, size, hashable)
+
+    def candidates(self, context):
+        found, value = self.value(context)
+        if not found:
+            return None
+        try:
+            rows = self.buckets.get(value)
+        except TypeError:
+            return None
+        return self.free | rows if rows else self.free
+
+
+class RangeFilter(IndexFilter):
+    """
+    Sorted thresholds of gt/gte/lt/lte tests of a field, searched with
+    bisect.
+    """
+    def __init__(self, field, op, size, entries):
+        super(RangeFilter, self).__init__(field, op, size, entries)
+        entries = sorted(entries, key=lambda entry: entry[1])
+        self.thresholds = [value for _row, value in entries]
+        self.rows = [row for row, _value in entries]
+
+    def candidates(self, context):
+        found, value = self.value(context)
+        if not found:
+            return None
+        try:
+            if self.op == 'gt':
+                rows = self.rows[:bisect.bisect_left(self.thresholds, value)]
+            elif self.op == 'gte':
+                rows = self.rows[:bisect.bisect_right(self.thresholds, value)]
+            elif self.op == 'lt':
+                rows = self.rows[bisect.bisect_right(self.thresholds, value):]
+            else:
+                rows = self.rows[bisect.bisect_left(self.thresholds, value):]
+        except TypeError:
+            return None
+        return self.free.union(rows)
+
+
+class RowIndex(object):
+    """
+    Discrimination index over the rows of a TableRule (similar to the alpha
+    network of Rete). Equality and range tests that must hold for a row and
+    are shared by several rows are indexed, so candidate rows can be found
+    without evaluating every row. Candidates still have to be evaluated.
+
+    Rows ruled out by the index aren't evaluated, so lookup errors that
+    their other conditions would raise are not raised.
+    """
+    def __init__(self, evaluators):
+        self.size = len(evaluators)
+        groups = {}
+        for row, evaluator in enumerate(evaluators):
+            seen = set()
+            for expression, value in required_leaves(evaluator):
+                key = split_expression(expression)
+                if key is None or key in seen:
+                    continue
+                seen.add(key)
+                groups.setdefault(key, []).append((row, value))
+        self.filters = [
+            (RangeFilter if op in RANGE_OPS else EqualityFilter)(
+                field, op, self.size, entries)
+            for (field, op), entries in sorted(groups.items())
+            if len(entries) > 1]
+        self.roots = set(f.path.root for f in self.filters)
+
+    def candidates(self, context, start=0):
+        """
+        Return sorted indexes of rows from start on that may match context.
+        """
+        rows = None
+        for index_filter in self.filters:
+            found = index_filter.candidates(context)
+            if found is None:
+                continue
+            rows = found if rows is None else rows & found
+            if not rows:
+                break
+        if rows is None:
+            return range(start, self.size)
+        return sorted(row for row in rows if row >= start)
@@ -1,5 +1,8 @@
+import json
 import reversion
 from django.db import models
+from django.db.models.signals import post_delete, post_save, pre_save
+from . import artifacts, rules
 
 
 @reversion.register
@@ -8,6 +11,8 @@ class Rule(models.Model):
     slug = models.SlugField(unique=True)
     source = models.CharField(max_length=200)
     description = models.TextField(blank=True)
+    # Version stamp used to invalidate cached rules
+    updated_at = models.DateTimeField(auto_now=True, null=True)
 
     def __unicode__(self):
         return self.name
@@ -23,6 +28,64 @@ class TableRule(Rule):
     definition = models.TextField()
     tablerule_format = models.PositiveSmallIntegerField(
         choices=TABLE_FORMATS, default=TF_YAML)
+    # Precompiled rule, see pyrules.artifacts
+    compiled = models.BinaryField(null=True, editable=False)
+    # JSON statistics of adaptive rules, see rules.TableRule
+    condition_stats = models.TextField(blank=True, editable=False)
+
+    def save(self, *args, **kwargs):
+        if self.pk and self.condition_stats:
+            # Statistics are by row, they don't apply to other rows
+            old = TableRule.objects.filter(pk=self.pk).values_list(
+                'definition', 'tablerule_format').first()
+            if old != (self.definition, self.tablerule_format):
+                self.condition_stats = ''
+        try:
+            self.compiled = self.compile()
+        except Exception:
+            # Definitions may be invalid while being edited. Loading the
+            # rule will raise the error.
+            self.compiled = None
+        super(TableRule, self).save(*args, **kwargs)
+
+    def load_rule(self):
+        """
+        Return the rules.TableRule of this definition, from the precompiled
+        artifact if it's up to date.
+        """
+        rule_obj = artifacts.loads(
+            self.compiled, self.definition, self.tablerule_format)
+        if rule_obj is None:
+            self.compiled = self.compile()
+            TableRule.objects.filter(pk=self.pk).update(
+                compiled=self.compiled)
+            rule_obj = artifacts.loads(
+                self.compiled, self.definition, self.tablerule_format)
+        if self.condition_stats and rule_obj.adaptive:
+            rule_obj.set_condition_stats(json.loads(self.condition_stats))
+        return rule_obj
+
+    def save_condition_stats(self, rule_obj):
+        """
+        Save the condition statistics of an adaptive rule loaded from this
+        definition. Cached rules aren't invalidated.
+        """
+        self.condition_stats = json.dumps(rule_obj.get_condition_stats())
+        TableRule.objects.filter(pk=self.pk).update(
+            condition_stats=self.condition_stats)
+
+    def compile(self):
+        """
+        Parse the definition and return its artifact.
+        """
+        if self.tablerule_format == self.TF_JSON:
+            rule_obj = rules.TableRule.from_json(self.definition)
+        elif self.tablerule_format == self.TF_YAML:
+            rule_obj = rules.TableRule.from_yaml(self.definition)
+        else:
+            raise NotImplementedError('Unknown format')
+        return artifacts.dumps(
+            rule_obj, self.definition, self.tablerule_format)
 
 
 class RulePosition(models.Model):
@@ -48,4 +111,26 @@ class Ruleset(models.Model):
     name = models.CharField(max_length=100, unique=True)
 
     def __unicode__(self):
-        return self.name
\ No newline at end of file
+        return self.name
+
+
+def _rules_saving(sender, instance, **kwargs):
+    # Slugs, names and rulesets may change, drop entries of the old ones
+    if issubclass(sender, (Rule, RulePosition, Ruleset)) and instance.pk:
+        from .storages.cache import invalidate
+        old = sender.objects.filter(pk=instance.pk).first()
+        if old is not None:
+            invalidate(old)
+
+
+def _rules_changed(sender, instance, **kwargs):
+    if issubclass(sender, (Rule, RulePosition, Ruleset)):
+        from .storages.cache import invalidate
+        from .worker import rules_changed
+        invalidate(instance)
+        rules_changed()
+
+
+pre_save.connect(_rules_saving, dispatch_uid='pyrules_rules_saving')
+post_save.connect(_rules_changed, dispatch_uid='pyrules_rules_saved')
+post_delete.connect(_rules_changed, dispatch_uid='pyrules_rules_deleted')
@@ -0,0 +1,60 @@
+import itertools
+import multiprocessing
+from .engine import RuleContext, RuleEngine
+
+
+# Engine and ruleset of a worker process, set by _init_worker
+_worker = None
+
+
+def _init_worker(engine, ruleset):
+    global _worker
+    _worker = engine, ruleset
+
+
+def _execute_chunk(records):
+    engine, ruleset = _worker
+    return [
+        (context.to_dict(copy=False), context._executed)
+        for context in engine.execute_batch(ruleset, records)]
+
+
+class ParallelRuleEngine(RuleEngine):
+    """
+    Rule engine executing batches of contexts in a pool of worker processes.
+    Every worker receives the ruleset once when the pool starts, contexts
+    are sent in chunks and results come back in the original order.
+
+    @param processes: number of worker processes, defaults to CPU count
+    @param chunksize: number of contexts sent to a worker at once
+    """
+    def __init__(self, processes=None, chunksize=100, **kwargs):
+        super(ParallelRuleEngine, self).__init__(**kwargs)
+        self.processes = processes
+        self.chunksize = chunksize
+
+    def execute_batch(self, ruleset, records):
+        return list(self.iter_batch(ruleset, records))
+
+    def iter_batch(self, ruleset, records):
+        """
+        Execute ruleset for each of the records, yielding RuleContexts in
+        the order of records as chunks are finished.
+        """
+        records = iter(records)
+        chunks = iter(
+            lambda: list(itertools.islice(records, self.chunksize)), [])
+        pool = multiprocessing.Pool(
+            self.processes, _init_worker,
+            (RuleEngine(memoize=self.memoize, trace=self.trace,
+                        trace_size=self.trace_size), ruleset))
+        try:
+            for chunk in pool.imap(_execute_chunk, chunks):
+                for data, executed in chunk:
+                    context = RuleContext(data)
+                    context._executed = executed
+                    yield context
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
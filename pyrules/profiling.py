@@ -0,0 +1,181 @@
+"""
+Opt-in profiling of rule execution, see Profiler.
+"""
+from timeit import default_timer
+from .rules import HitPolicyError
+
+
+class RuleStats(object):
+    """
+    Aggregated statistics of a rule or TableRule row. Times are seconds,
+    conditions maps condition names (i.e. 'cond1') to [true, evaluated]
+    counts.
+    """
+    def __init__(self):
+        self.calls = 0
+        self.triggered = 0
+        self.time = 0.0
+        self.condition_time = 0.0
+        self.action_time = 0.0
+        self.conditions = {}
+
+
+class Profiler(object):
+    """
+    Records wall time, trigger counts and, for TableRule rows, condition
+    and action time and how often each condition was true. Statistics are
+    aggregated by path, i.e. ('Pricing', 'Discounts', 'row 3'), over all
+    contexts executed by engines using the profiler:
+
+    >>> profiler = Profiler()
+    >>> engine = RuleEngine(profiler=profiler)
+    >>> print profiler.report()
+
+    Rows of indexed TableRules are all evaluated while profiling, rows of
+    TableRules with a hit policy up to the one that fires. Every condition
+    of a row is evaluated once on its own before the row fires, to count
+    how often it's true, so condition time includes conditions and/or
+    would skip. Profilers aren't thread-safe and only see contexts
+    executed in their own process.
+    """
+    REPORT_FORMAT = u'{:<40} {:>8} {:>8} {:>10} {:>10} {:>10}  {}'
+
+    def __init__(self):
+        self.stats = {}
+        self._stack = []
+
+    def _get(self, key):
+        try:
+            return self.stats[key]
+        except KeyError:
+            stats = self.stats[key] = RuleStats()
+            return stats
+
+    def run(self, rule, context):
+        """
+        Trigger, perform and record rule like RuleEngine.execute, timed.
+        """
+        self._stack.append(rule.ruleid)
+        try:
+            start = default_timer()
+            triggered = rule.should_trigger(context)
+            if triggered:
+                result = rule.perform(context)
+                rule.record(context, result)
+            elapsed = default_timer() - start
+            stats = self._get(tuple(self._stack))
+            stats.calls += 1
+            stats.triggered += bool(triggered)
+            stats.time += elapsed
+        finally:
+            self._stack.pop()
+
+    def perform_table(self, trule, context):
+        """
+        Perform a TableRule like TableRule.perform, timing every row.
+        """
+        prefix = tuple(self._stack)
+        count = 0
+        single = trule.hit_policy != 'collect'
+        hit = None
+        rows = trule._ranking[0] if single else range(len(trule.rules))
+        for index in rows:
+            stats = self._row_stats(prefix, trule, index)
+            start = default_timer()
+            fired = self._evaluate_row(
+                trule._evaluators[index], context, stats)
+            evaluated = default_timer()
+            if fired and not single:
+                count = count + 1
+                trule._fire(index, context, count)
+            done = default_timer()
+            stats.calls += 1
+            stats.triggered += bool(fired)
+            stats.time += done - start
+            stats.condition_time += evaluated - start
+            stats.action_time += done - evaluated
+            if fired and single:
+                if hit is not None:
+                    raise HitPolicyError(
+                        'Rows {} and {} of {} match, hit policy is '
+                        'unique'.format(hit + 1, index + 1, trule.ruleid))
+                hit = index
+                if trule.hit_policy != 'unique':
+                    break
+        if hit is not None:
+            start = default_timer()
+            trule._hit(hit)
+            trule._fire(hit, context, 1)
+            elapsed = default_timer() - start
+            stats = self._row_stats(prefix, trule, hit)
+            stats.time += elapsed
+            stats.action_time += elapsed
+        return True
+
+    def _row_stats(self, prefix, trule, index):
+        return self._get(prefix + (
+            trule.rules[index].get('rule') or 'row {}'.format(index + 1),))
+
+    def _evaluate_row(self, evaluator, context, stats):
+        """
+        Evaluate every condition of a row once, count the true ones in
+        stats and return whether the row fires.
+        """
+        if evaluator._force_conditions is not None:
+            return evaluator._force_conditions
+        results = {}
+        for name, condition in evaluator._compiled_conditions():
+            try:
+                true = results[name] = condition(context)
+            except Exception as e:
+                # Raised by evaluate_results if the logic needs it
+                results[name] = e
+                continue
+            counts = stats.conditions.setdefault(name, [0, 0])
+            counts[0] += bool(true)
+            counts[1] += 1
+        return evaluator.evaluate_results(results)
+
+    def self_time(self, key):
+        """
+        Return the time spent in key itself, not in rules or rows below it.
+        """
+        size = len(key) + 1
+        return self.stats[key].time - sum(
+            stats.time for other, stats in self.stats.iteritems()
+            if len(other) == size and other[:-1] == key)
+
+    def report(self, limit=None):
+        """
+        Return a text table of the statistics, slowest first.
+        """
+        lines = [self.REPORT_FORMAT.format(
+            'rule', 'calls', 'trig', 'total ms', 'cond ms', 'action ms',
+            'conditions true/evaluated')]
+        keys = sorted(
+            self.stats, key=lambda key: self.stats[key].time, reverse=True)
+        for key in keys[:limit]:
+            stats = self.stats[key]
+            conditions = ' '.join(
+                '{}={}/{}'.format(name, *counts)
+                for name, counts in sorted(stats.conditions.items()))
+            lines.append(self.REPORT_FORMAT.format(
+                u' > '.join(map(unicode, key)), stats.calls, stats.triggered,
+                '{:.3f}'.format(stats.time * 1000),
+                '{:.3f}'.format(stats.condition_time * 1000),
+                '{:.3f}'.format(stats.action_time * 1000), conditions))
+        return u'\n'.join(lines)
+
+    def collapsed(self):
+        """
+        Return the statistics as collapsed stacks with self time in
+        microseconds, i.e. 'Pricing;Discounts;row 3 120', for flame graph
+        tools.
+        """
+        return u'\n'.join(
+            u'{} {}'.format(
+                u';'.join(map(unicode, key)), int(self.self_time(key) * 1e6))
+            for key in sorted(self.stats))
+
+    def reset(self):
+        self.stats.clear()
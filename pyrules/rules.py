@@ -1,9 +1,15 @@
 import json
-import yaml
+import marshal
+import threading
 from .conditions import LogicEvaluator
 from .dictobj import DictObject
+from .index import RowIndex
 from .language import Translator
 
+
+class HitPolicyError(Exception):
+    pass
+
      
 class Rule(object):
     """
@@ -17,8 +23,19 @@ class Rule(object):
     def perform(self, context):
         raise NotImplementedError
 
-    def record(self, context, result):
-        context._executed.append((self.ruleid, result))
+    def lookups(self, context):
+        """
+        Return I/O-bound lookups the rule needs as a dict of context key ->
+        function(context), i.e. to fetch enrichment data. Engines that
+        support it (see pyrules.asynchronous.AsyncRuleEngine) run them
+        concurrently before rules are executed.
+        """
+        return {}
+
+    def record(self, context, result, ruleid=None):
+        trace = context._executed
+        if trace.level:
+            trace.record(ruleid or self.ruleid, result)
 
     @property
     def ruleid(self):
@@ -32,6 +49,7 @@ class ConditionalRule(Rule):
     
     @param condition: lambda context: <some condition returning True or False>
     @param action: lambda context: <return a dict to update the context with>
+    @param lookups: dict of context key -> function(context), see lookups
     
     Example:
     
@@ -39,9 +57,13 @@ class ConditionalRule(Rule):
     ...     condition=lambda context: True,
     ...     action=lambda context: {'result': 5})
     """
-    def __init__(self, condition=None, action=None):
+    def __init__(self, condition=None, action=None, lookups=None):
         self._condition = condition
         self._action = action
+        self._lookups = lookups or {}
+
+    def lookups(self, context):
+        return self._lookups
 
     def condition(self, context):
         """
@@ -91,57 +113,272 @@ class TableRule(Rule):
 
     The result of the nth 'then' action is stored in the nth 'context.variable'
     as defined in target.
+
+    With indexed=True, equality and range conditions shared by rows are
+    indexed (see pyrules.index.RowIndex) and only candidate rows are
+    evaluated. Results and order are the same as scanning all rows.
+
+    The hit policy decides which matching rows fire:
+
+    * collect: all of them, in order (default)
+    * first: the first one, rows after it aren't evaluated
+    * unique: the only one, raises HitPolicyError if several rows match
+    * priority: the one with the highest 'priority' value (0 if not set),
+      rows are evaluated by priority and the first match fires
+    * any: any one of them, rows are expected to give the same results.
+      Rows are evaluated in order of how often they fired so far, so the
+      usual matches are found after a few rows
+
+    With any policy but collect, all rows are evaluated before actions run,
+    so actions don't change which row fires.
+
+    With adaptive=True, conditions of each row are evaluated in the order
+    that turned out cheapest so far, see LogicEvaluator. The statistics can
+    be saved with get_condition_stats and loaded with set_condition_stats.
+
+    The hit policy and adaptive can be given as 'hit_policy' and 'adaptive'
+    in YAML and JSON definitions.
     """
-    def __init__(self, rules, name=None):
+    HIT_POLICIES = ('collect', 'first', 'unique', 'priority', 'any')
+
+    def __init__(self, rules, name=None, indexed=False, hit_policy='collect',
+                 adaptive=False):
         self.rules = self._load_data({'rules': rules})
         if name:
             self.name = name
         
-        self._current_ruleid = None
-        self._evaluators = []
-        for rule in self.rules:
-            evaluator = LogicEvaluator(
-                rule['if'].get('logic'), rule['if']['conditions'])
-            self._evaluators.append(evaluator)
+        self._evaluators = [
+            LogicEvaluator(
+                rule['if'].get('logic'), rule['if']['conditions'], adaptive)
+            for rule in self.rules]
+        self._hits = [0] * len(self.rules)
+        self._setup(indexed, hit_policy)
+
+    def _setup(self, indexed, hit_policy='collect', codes=None):
+        """
+        Compile actions and build the index for rows and evaluators.
+
+        @param codes: code objects of the actions by row, None for constant
+            actions, as kept in _codes. Compiled if not given.
+        """
+        if hit_policy not in self.HIT_POLICIES:
+            raise ValueError('Unknown hit policy {!r}, use one of {}'.format(
+                hit_policy, ', '.join(self.HIT_POLICIES)))
+        self.hit_policy = hit_policy
+        # Guards hit counts, rules are shared by threads (see RuleStore)
+        self._lock = threading.Lock()
+        # Rows in evaluation order and the position of each row in it
+        order = range(len(self.rules))
+        if hit_policy == 'priority':
+            order.sort(
+                key=lambda index: -self.rules[index].get('priority', 0))
+        elif hit_policy == 'any':
+            order.sort(key=lambda index: -self._hits[index])
+        rank = [0] * len(order)
+        for position, index in enumerate(order):
+            rank[index] = position
+        self._ranking = order, rank
+        if codes is None:
+            codes = [
+                [self._compile_action(action) for action in rule['then']]
+                for rule in self.rules]
+        self._codes = codes
+        self._actions = [
+            [(target.replace('context.', '').strip(),
+              self._make_action(action, code))
+             for action, target, code in zip(
+                 rule['then'], rule['target'], row_codes)]
+            for rule, row_codes in zip(self.rules, codes)]
+        self._index = RowIndex(self._evaluators) if indexed else None
+        if indexed:
+            # Rows writing to indexed fields require new candidates
+            self._reindex = [
+                bool(self._index.roots.intersection(
+                    target for target, _action in actions))
+                for actions in self._actions]
 
     def perform(self, context):
+        if context._profiler is not None:
+            return context._profiler.perform_table(self, context)
+        if self.hit_policy != 'collect':
+            return self._perform_single(context)
+        if self._index is not None:
+            return self._perform_indexed(context)
         count = 0
-        for evaluator, rule in zip(self._evaluators, self.rules):
-            if evaluator.evaluate(context):
+        memo = context._memo
+        for index, evaluator in enumerate(self._evaluators):
+            if evaluator.evaluate(context, memo):
                 count = count + 1
-                self._current_ruleid = rule.get('rule') or count
-                for action, target in zip(rule['then'], rule['target']):
-                    result = \
-                        context[target.replace('context.', '').strip()] = (
-                            eval(action, {'context': context})
-                            if isinstance(action, basestring)
-                            else action)
-                    self.record(context, result)
-            else:
-                continue            
-        else:
-            self._current_ruleid = None
-            return True
-        return False
+                self._fire(index, context, count)
+        return True
+
+    def _rows(self, context):
+        """
+        Return the indexes of rows to evaluate in order of the hit policy.
+        """
+        order, rank = self._ranking
+        if self._index is None:
+            return order
+        rows = self._index.candidates(context)
+        if self.hit_policy in ('priority', 'any'):
+            rows = sorted(rows, key=rank.__getitem__)
+        return rows
+
+    def _perform_single(self, context):
+        memo = context._memo
+        unique = self.hit_policy == 'unique'
+        hit = None
+        for index in self._rows(context):
+            if self._evaluators[index].evaluate(context, memo):
+                if hit is not None:
+                    raise HitPolicyError(
+                        'Rows {} and {} of {} match, hit policy is '
+                        'unique'.format(hit + 1, index + 1, self.ruleid))
+                hit = index
+                if not unique:
+                    break
+        if hit is not None:
+            self._hit(hit)
+            self._fire(hit, context, 1)
+        return True
+
+    def _hit(self, index):
+        """
+        Count a hit of the row at given index with the any policy. The row
+        moves ahead of the row before it once it fired more often.
+        """
+        if self.hit_policy != 'any':
+            return
+        with self._lock:
+            hits = self._hits
+            hits[index] += 1
+            order, rank = self._ranking
+            position = rank[index]
+            if position and hits[index] > hits[order[position - 1]]:
+                # Replaced, not changed in place, for threads reading it
+                order, rank = list(order), list(rank)
+                before = order[position - 1]
+                order[position - 1], order[position] = index, before
+                rank[index], rank[before] = position - 1, position
+                self._ranking = order, rank
+
+    def _perform_indexed(self, context):
+        count = 0
+        memo = context._memo
+        rows = self._index.candidates(context)
+        position = 0
+        while position < len(rows):
+            index = rows[position]
+            position += 1
+            if self._evaluators[index].evaluate(context, memo):
+                count = count + 1
+                self._fire(index, context, count)
+                if self._reindex[index]:
+                    rows = self._index.candidates(context, index + 1)
+                    position = 0
+        return True
+
+    def _fire(self, index, context, count):
+        """
+        Run the precompiled actions of the row at given index and store
+        their results in the context. count is the number of rows fired so
+        far, it identifies rows without a name in the trace.
+        """
+        ruleid = (
+            self.row_ruleid(index, count) if context._executed.level
+            else None)
+        for target, action in self._actions[index]:
+            result = context[target] = action(context)
+            self.record(context, result, ruleid)
+
+    def row_ruleid(self, index, count):
+        """
+        Return the id of the row at given index in the trace, i.e.
+        'Pricing.discount'.
+        """
+        return '%s.%s' % (self.ruleid, self.rules[index].get('rule') or count)
 
     @property
-    def ruleid(self):
-        if self._current_ruleid:
-            return "%s.%s" % (super(TableRule, self).ruleid, self._current_ruleid)
-        return super(TableRule, self).ruleid
+    def adaptive(self):
+        return any(evaluator.adaptive for evaluator in self._evaluators)
+
+    def get_condition_stats(self):
+        """
+        Return the condition statistics of adaptive rows as a JSON
+        serializable list, None for rows that aren't adaptive.
+        """
+        return [
+            evaluator.get_stats() if evaluator.adaptive else None
+            for evaluator in self._evaluators]
+
+    def set_condition_stats(self, stats):
+        """
+        Load statistics returned by get_condition_stats. They are ignored
+        if the number of rows changed.
+        """
+        if len(stats) != len(self._evaluators):
+            return
+        for evaluator, row_stats in zip(self._evaluators, stats):
+            if evaluator.adaptive and row_stats:
+                evaluator.set_stats(row_stats)
+
+    @staticmethod
+    def _compile_action(action):
+        """
+        Compile a 'then' action once, so it isn't parsed on every row hit.
+        Returns the code object, None for non-string actions.
+        """
+        if isinstance(action, basestring):
+            return compile(action, '<action>', 'eval')
+        return None
+
+    @staticmethod
+    def _make_action(action, code):
+        """
+        Return a callable taking the context for an action compiled by
+        _compile_action. Non-string actions are constants.
+        """
+        if code is not None:
+            return lambda context: eval(code, {'context': context})
+        return lambda context: action
+
+    def __getstate__(self):
+        # Actions are pickled as marshalled code objects, evaluators keep
+        # their parsed and compiled logic, see LogicEvaluator
+        return {
+            'rules': self.rules, 'name': self.name,
+            'evaluators': self._evaluators,
+            'codes': marshal.dumps(self._codes),
+            'indexed': self._index is not None,
+            'hit_policy': self.hit_policy, 'hits': self._hits}
+
+    def __setstate__(self, state):
+        self.rules = state['rules']
+        if state['name']:
+            self.name = state['name']
+        self._evaluators = state['evaluators']
+        self._hits = state.get('hits') or [0] * len(self.rules)
+        codes = state.get('codes')
+        self._setup(
+            state['indexed'], state.get('hit_policy', 'collect'),
+            marshal.loads(codes) if codes is not None else None)
 
     @classmethod
-    def from_yaml(cls, text):
-        return cls._from_data(yaml.load(text))
+    def from_yaml(cls, text, **kwargs):
+        import yaml
+        return cls._from_data(yaml.load(text), **kwargs)
         
     @classmethod
-    def from_json(cls, text):
-        return cls._from_data(json.loads(text))
+    def from_json(cls, text, **kwargs):
+        return cls._from_data(json.loads(text), **kwargs)
 
     @classmethod
-    def _from_data(cls, data):
+    def _from_data(cls, data, **kwargs):
         rules = cls._load_data(data)
-        return cls(rules, name=data.get('ruleset'))
+        for key in ('hit_policy', 'adaptive'):
+            if key in data:
+                kwargs.setdefault(key, data[key])
+        return cls(rules, name=data.get('ruleset'), **kwargs)
 
     @staticmethod
     def _load_data(data):
@@ -157,6 +394,8 @@ class TableRule(Rule):
                 'rule': rule.get('rule'),
                 'then': rule['then'],
                 'target': rule['target']}
+            if 'priority' in rule:
+                obj['priority'] = rule['priority']
             if_clause = {}
             # Convert conditions to dictionaries, i.e. "foo" becomes {"foo": True}
             if isinstance(rule['if'], list):
@@ -175,18 +414,65 @@ class TableRule(Rule):
 class SequencedRuleset(Rule):
     """
     A set of Rules, guaranteed to run in sequence
+
+    With skip_unchanged=True, only rules affected by values changed since
+    the ruleset last ran in the same context are run again, i.e. when a
+    context is executed again after some values changed (see
+    pyrules.dependencies.DependencyGraph.affected). The context ends up the
+    same as running all rules, skipped rules aren't traced. Rules that
+    can't be analysed always run, and so do all rules after them. Values
+    changed in place (i.e. list.append) aren't detected.
     """
-    def __init__(self, rules):
+    def __init__(self, rules, skip_unchanged=False):
         self.rules = rules or []
+        self.skip_unchanged = skip_unchanged
+        self._graph = None
 
     def should_trigger(self, context):
         return True
 
+    def lookups(self, context):
+        lookups = {}
+        for rule in self.rules:
+            lookups.update(rule.lookups(context))
+        return lookups
+
     def perform(self, context):
+        if self.skip_unchanged:
+            return self._perform_changed(context)
+        profiler = context._profiler
         for rule in self.rules:
-            if rule.should_trigger(context):
+            if profiler is not None:
+                profiler.run(rule, context)
+            elif rule.should_trigger(context):
+                result = rule.perform(context)
+                rule.record(context, result)
+        return True
+
+    def _perform_changed(self, context):
+        from .dependencies import DependencyGraph
+        graph = self._graph
+        if graph is None or graph.rules != list(self.rules):
+            graph = self._graph = DependencyGraph(self.rules)
+        if context._state is None:
+            context._state = {}
+        # Values of the analysed keys after the last run
+        seen = context._state.get(self)
+        if seen is None:
+            indexes = xrange(len(self.rules))
+        else:
+            indexes = graph.affected(
+                key for key, value in seen.iteritems()
+                if context[key] != value)
+        for index in indexes:
+            rule = self.rules[index]
+            if context._profiler is not None:
+                context._profiler.run(rule, context)
+            elif rule.should_trigger(context):
                 result = rule.perform(context)
                 rule.record(context, result)
+        context._state[self] = dict(
+            (key, context[key]) for key in graph.known_keys)
         return True
 
 
@@ -0,0 +1,159 @@
+"""
+Incremental re-evaluation of a ruleset for a context that changes a few
+keys at a time, see RuleEngine.session.
+"""
+from .dependencies import action_keys, condition_keys
+from .engine import RuleContext
+from .rules import SequencedRuleset, TableRule
+
+
+def _performs_as(rule, cls):
+    return type(rule).perform.__func__ is cls.perform.__func__
+
+
+class RuleSession(object):
+    """
+    Keeps the results of executing a ruleset for some input values, so it
+    can be executed again for changed values with little work (truth
+    maintenance like in Rete). Every update gives the same context as
+    executing the ruleset on the updated values from scratch.
+
+    TableRule rows are evaluated again only if a key their conditions look
+    up changed, actions run again only if a key they read changed or the
+    row fired differently. Actions whose reads can't be determined (see
+    pyrules.dependencies.action_keys), i.e. calling context.to_dict(), run
+    every time. Results of other rows are reused. Other rules, and
+    TableRules with a hit policy, are always executed again. Values changed
+    in place (i.e. by list.append) aren't detected, pass them in the delta.
+
+    @param engine: RuleEngine setting up the contexts
+    @param ruleset: list of rules
+    @param initial: dict of input values
+    """
+    def __init__(self, engine, ruleset, initial=None):
+        self.engine = engine
+        self.ruleset = list(ruleset)
+        self.inputs = dict(initial or {})
+        # TableRules and (fired, results) per row, by position in ruleset
+        self._rows = {}
+        # Context data after other rules, by position in ruleset
+        self._snapshots = {}
+        self._keys = {}
+        self.evaluated = 0
+        self.context = self._execute(set(self.inputs))
+
+    def update(self, delta):
+        """
+        Change input values and execute the ruleset again, returns the new
+        context.
+        """
+        changed = set(
+            key for key, value in delta.items()
+            if key not in self.inputs or self.inputs[key] != value)
+        self.inputs.update(delta)
+        self.context = self._execute(changed)
+        return self.context
+
+    def _execute(self, changed):
+        context = RuleContext(self.inputs)
+        self.engine.prepare(context)
+        self.evaluated = 0
+        self._execute_rules(self.ruleset, context, set(changed), ())
+        return context
+
+    def _execute_rules(self, rules, context, changed, position):
+        for i, rule in enumerate(rules):
+            key = position + (i,)
+            if not rule.should_trigger(context):
+                self._forget(key, changed)
+                continue
+            if _performs_as(rule, SequencedRuleset):
+                self._execute_rules(rule.rules, context, changed, key)
+                result = True
+            elif (_performs_as(rule, TableRule) and
+                    rule.hit_policy == 'collect'):
+                result = self._perform_table(rule, context, changed, key)
+            else:
+                result = rule.perform(context)
+                data = context.to_dict()
+                before = self._snapshots.get(key, {})
+                changed.update(
+                    name for name in set(data) | set(before)
+                    if name not in data or name not in before or
+                    data[name] != before[name])
+                self._snapshots[key] = data
+            rule.record(context, result)
+
+    def _forget(self, position, changed):
+        """
+        Drop results of the rule at position and the rules it contains,
+        whatever they wrote last time is considered changed.
+        """
+        size = len(position)
+        for key in self._snapshots.keys():
+            if key[:size] == position:
+                changed.update(self._snapshots.pop(key))
+        for key in self._rows.keys():
+            if key[:size] == position:
+                trule, _rows = self._rows.pop(key)
+                changed.update(
+                    target for actions in trule._actions
+                    for target, _action in actions)
+
+    def _row_keys(self, trule):
+        """
+        Return (condition keys, action keys) per row, action keys are None
+        if they can't be determined.
+        """
+        try:
+            return self._keys[trule]
+        except KeyError:
+            pass
+        keys = []
+        for evaluator, row in zip(trule._evaluators, trule.rules):
+            reads = set()
+            for action in row['then']:
+                found = action_keys(action)
+                if found is None:
+                    reads = None
+                    break
+                reads |= found
+            keys.append((condition_keys(evaluator), reads))
+        self._keys[trule] = keys
+        return keys
+
+    def _perform_table(self, trule, context, changed, key):
+        previous = self._rows.get(key, (None, None))[1]
+        rows = []
+        memo = context._memo
+        count = 0
+        for index, evaluator in enumerate(trule._evaluators):
+            cond_keys, act_keys = self._row_keys(trule)[index]
+            old = previous[index] if previous else None
+            if old is None or cond_keys & changed:
+                fired = evaluator.evaluate(context, memo)
+                self.evaluated += 1
+            else:
+                fired = old[0]
+            results = None
+            actions = trule._actions[index]
+            if fired:
+                count = count + 1
+                ruleid = trule.row_ruleid(index, count)
+                if (old is not None and old[0] and act_keys is not None and
+                        not act_keys & changed):
+                    results = old[1]
+                    for (target, _action), result in zip(actions, results):
+                        context[target] = result
+                        trule.record(context, result, ruleid)
+                else:
+                    results = []
+                    for target, action in actions:
+                        result = context[target] = action(context)
+                        trule.record(context, result, ruleid)
+                        results.append(result)
+            if old is None or fired != old[0] or results != old[1]:
+                changed.update(target for target, _action in actions)
+            rows.append((fired, results))
+        self._rows[key] = trule, rows
+        return True
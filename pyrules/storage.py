@@ -1,16 +1,66 @@
 from django.conf import settings
 from django.utils.module_loading import import_by_path
+from .cache import RuleCache
+
+
+# Storage instances by backend path and the process-wide rule cache
+_storages = {}
+_cache = None
+
+
+def get_cache():
+    """
+    Return the process-wide RuleCache, configured by the PYRULES_CACHE_SIZE
+    (0 disables caching) and PYRULES_CACHE_TTL settings.
+    """
+    global _cache
+    if _cache is None:
+        _cache = RuleCache(
+            max_size=getattr(settings, 'PYRULES_CACHE_SIZE', 128),
+            ttl=getattr(settings, 'PYRULES_CACHE_TTL', None))
+    return _cache
 
 
 class RuleStore(object):
-    def __init__(self, backend=None):
-        backend = backend or getattr(
+    """
+    Loads rules and rulesets from the storage backend. Constructed rules
+    are kept in the process-wide cache and reused as long as the version
+    stamp reported by the backend doesn't change.
+
+    @param check_versions: if False, cached rules are used without asking
+        the backend for versions, until the cache is invalidated (see
+        pyrules.worker). Defaults to the PYRULES_CACHE_CHECK_VERSIONS
+        setting, True if it isn't set.
+    """
+    def __init__(self, backend=None, cache=None, check_versions=None):
+        self.backend = backend or getattr(
             settings, 'PYRULES_STORAGE',
             'pyrules.storages.django.DjangoStorage')
-        self.storage = import_by_path(backend)()
+        try:
+            self.storage = _storages[self.backend]
+        except KeyError:
+            self.storage = _storages[self.backend] = import_by_path(
+                self.backend)()
+        self.cache = cache or get_cache()
+        if check_versions is None:
+            check_versions = getattr(
+                settings, 'PYRULES_CACHE_CHECK_VERSIONS', True)
+        self.check_versions = check_versions
 
     def get_rule(self, name):
-        return self.storage.get_rule(name)
+        if not isinstance(name, basestring):
+            return self.storage.get_rule(name)
+        return self.cache.get(
+            (self.backend, 'rule', name),
+            self._version(self.storage.get_rule_version, name),
+            lambda: self.storage.get_rule(name))
             
     def get_ruleset(self, name):
-        return self.storage.get_ruleset(name)
\ No newline at end of file
+        return self.cache.get(
+            (self.backend, 'ruleset', name),
+            self._version(self.storage.get_ruleset_version, name),
+            lambda: self.storage.get_ruleset(name))
+
+    def _version(self, get_version, name):
+        # Without checks all cached entries share one version
+        return get_version(name) if self.check_versions else 0
@@ -4,3 +4,41 @@ class BaseStorage(object):
 
     def get_ruleset(self, name):
         raise NotImplementedError()
+
+    def get_rulesets(self, names):
+        """
+        Return a dict of the rules of each of the named rulesets.
+        """
+        return dict((name, self.get_ruleset(name)) for name in names)
+
+    def get_rule_version(self, name):
+        """
+        Return a cheap version stamp of a rule that changes whenever the
+        rule changes, or None if the storage doesn't support versions.
+        """
+        return None
+
+    def get_ruleset_version(self, name):
+        """
+        Like get_rule_version, but for a ruleset and the rules in it.
+        """
+        return None
+
+    def get_rule_definition(self, name):
+        """
+        Return a picklable definition of a rule, see build_rule. Defaults to
+        the rule itself.
+        """
+        return self.get_rule(name)
+
+    def get_ruleset_definitions(self, names):
+        """
+        Like get_rulesets, but returns the definitions of the rules.
+        """
+        return self.get_rulesets(names)
+
+    def build_rule(self, definition):
+        """
+        Return the rule of a definition returned by get_rule_definition.
+        """
+        return definition
@@ -0,0 +1,165 @@
+"""
+Storage keeping rule definitions in Django's cache framework, see
+CachedStorage.
+"""
+from __future__ import absolute_import
+import urllib
+from django.conf import settings
+from django.core.cache import get_cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.utils.module_loading import import_by_path
+from . import base
+from .. import models
+from ..cache import RuleCache
+
+
+KEY_PREFIX = 'pyrules'
+
+
+def rule_key(name):
+    return '{}:rule:{}'.format(KEY_PREFIX, urllib.quote(name.encode('utf-8')))
+
+
+def ruleset_key(name):
+    return '{}:ruleset:{}'.format(
+        KEY_PREFIX, urllib.quote(name.encode('utf-8')))
+
+
+def get_definition_cache():
+    """
+    Return the Django cache configured by PYRULES_CACHED_STORAGE_CACHE, the
+    'default' cache if it isn't set.
+    """
+    return get_cache(
+        getattr(settings, 'PYRULES_CACHED_STORAGE_CACHE', 'default'))
+
+
+def invalidate(instance):
+    """
+    Delete the cached entries depending on a models.Rule, Ruleset or
+    RulePosition. Called when they are saved or deleted, see pyrules.models.
+    """
+    if isinstance(instance, models.Rule):
+        keys = [rule_key(instance.slug)]
+        names = instance.rulesets.values_list('name', flat=True)
+    elif isinstance(instance, models.Ruleset):
+        keys = []
+        names = [instance.name]
+    elif isinstance(instance, models.RulePosition):
+        keys = []
+        names = models.Ruleset.objects.filter(
+            pk=instance.ruleset_id).values_list('name', flat=True)
+    else:
+        return
+    keys.extend(ruleset_key(name) for name in names)
+    get_definition_cache().delete_many(keys)
+
+
+class CachedStorage(base.BaseStorage):
+    """
+    Wraps a storage and keeps its rule definitions in a Django cache
+    (locmem, memcached, redis), so rules are loaded without asking the
+    wrapped storage, i.e. without database queries. Rulesets are cached
+    with the definitions of their rules and loaded with one multi-get.
+    Version stamps of the wrapped storage are cached with the definitions.
+
+    Rules built from the definitions are kept in a RuleCache of the
+    process and reused while the cached version stamp is unchanged, so
+    they are shared by all callers like RuleStore's. Without version stamps
+    rules are built on every call. Saving or deleting Django rules,
+    rulesets and positions deletes the entries depending on them, see
+    invalidate.
+
+    @param backend: storage or path of the storage to wrap, defaults to
+        the PYRULES_CACHED_STORAGE_BACKEND setting or DjangoStorage
+    @param cache: Django cache alias, see get_definition_cache
+    @param timeout: seconds to keep entries, defaults to the
+        PYRULES_CACHED_STORAGE_TIMEOUT setting or the cache's timeout
+    @param rules: RuleCache for the built rules, defaults to one with
+        PYRULES_CACHE_SIZE entries
+    """
+    def __init__(self, backend=None, cache=None, timeout=None, rules=None):
+        backend = backend or getattr(
+            settings, 'PYRULES_CACHED_STORAGE_BACKEND',
+            'pyrules.storages.django.DjangoStorage')
+        if isinstance(backend, basestring):
+            backend = import_by_path(backend)()
+        self.backend = backend
+        self.cache = get_cache(cache) if cache else get_definition_cache()
+        if timeout is None:
+            timeout = getattr(
+                settings, 'PYRULES_CACHED_STORAGE_TIMEOUT', DEFAULT_TIMEOUT)
+        self.timeout = timeout
+        self.rules = rules or RuleCache(
+            max_size=getattr(settings, 'PYRULES_CACHE_SIZE', 128))
+
+    def get_rule(self, name):
+        if not isinstance(name, basestring):
+            return self.backend.get_rule(name)
+        entry = self._rule_entry(name)
+        return self.rules.get(
+            rule_key(name), entry['version'],
+            lambda: self.backend.build_rule(entry['definition']))
+
+    def get_rule_version(self, name):
+        return self._rule_entry(name)['version']
+
+    def get_rule_definition(self, name):
+        return self._rule_entry(name)['definition']
+
+    def _rule_entry(self, name):
+        key = rule_key(name)
+        entry = self.cache.get(key)
+        if entry is None:
+            # The version is read first, changes in between are picked up
+            # by the next version check
+            entry = {
+                'version': self.backend.get_rule_version(name),
+                'definition': self.backend.get_rule_definition(name)}
+            self.cache.set(key, entry, self.timeout)
+        return entry
+
+    def get_ruleset(self, name):
+        return self.get_rulesets([name])[name]
+
+    def get_rulesets(self, names):
+        return dict(
+            (name, self._build_ruleset(name, entry))
+            for name, entry in self._ruleset_entries(names).iteritems())
+
+    def _build_ruleset(self, name, entry):
+        return self.rules.get(
+            ruleset_key(name), entry['version'],
+            lambda: map(self.backend.build_rule, entry['rules']))
+
+    def get_ruleset_version(self, name):
+        return self._ruleset_entries([name])[name]['version']
+
+    def get_ruleset_definitions(self, names):
+        return dict(
+            (name, entry['rules'])
+            for name, entry in self._ruleset_entries(names).iteritems())
+
+    def _ruleset_entries(self, names):
+        keys = dict((ruleset_key(name), name) for name in names)
+        entries = dict(
+            (keys[key], entry)
+            for key, entry in self.cache.get_many(keys.keys()).iteritems())
+        missing = [name for name in names if name not in entries]
+        if missing:
+            versions = dict(
+                (name, self.backend.get_ruleset_version(name))
+                for name in missing)
+            definitions = self.backend.get_ruleset_definitions(missing)
+            loaded = dict(
+                (name, {'version': versions[name], 'rules': definitions[name]})
+                for name in missing)
+            self.cache.set_many(
+                dict((ruleset_key(name), entry)
+                     for name, entry in loaded.iteritems()),
+                self.timeout)
+            entries.update(loaded)
+        return entries
+
+    def build_rule(self, definition):
+        return self.backend.build_rule(definition)
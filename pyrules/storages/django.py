@@ -1,7 +1,7 @@
 from __future__ import absolute_import
 from django.utils.module_loading import import_by_path
 from . import base
-from .. import models, rules
+from .. import models
 
 
 class DjangoStorage(base.BaseStorage):
@@ -9,21 +9,79 @@ class DjangoStorage(base.BaseStorage):
         if isinstance(rule, basestring):
             rule = models.Rule.objects.get(slug=rule)
         try:
-            trule = rule.tablerule
-            text = trule.definition
-            if trule.tablerule_format == models.TableRule.TF_JSON:
-                rule_obj = rules.TableRule.from_json(text)
-            elif trule.tablerule_format == models.TableRule.TF_YAML:
-                rule_obj = rules.TableRule.from_yaml(text)
-            else:
-                raise NotImplementedError('Unknown format')            
+            rule_obj = rule.tablerule.load_rule()
         except models.TableRule.DoesNotExist:
             rule_obj = import_by_path(rule.source)()
             rule_obj.name = rule.name
         return rule_obj
 
+    def get_rule_definition(self, rule):
+        """
+        Return the precompiled artifact and definition of a TableRule, or
+        the source of other rules.
+        """
+        if isinstance(rule, basestring):
+            rule = models.Rule.objects.get(slug=rule)
+        try:
+            trule = rule.tablerule
+        except models.TableRule.DoesNotExist:
+            return {'source': rule.source, 'name': rule.name}
+        # Rebuilds a stale artifact, so building the rule doesn't
+        trule.load_rule()
+        return {
+            'definition': trule.definition,
+            'tablerule_format': trule.tablerule_format,
+            'compiled': bytes(trule.compiled),
+            'condition_stats': trule.condition_stats}
+
+    def build_rule(self, definition):
+        if 'source' in definition:
+            rule_obj = import_by_path(definition['source'])()
+            rule_obj.name = definition['name']
+            return rule_obj
+        return models.TableRule(**definition).load_rule()
+
     def get_ruleset(self, name):
-        ruleset = models.Ruleset.objects.get(name=name)
-        return [
-            self.get_rule(rule_pos.rule) for rule_pos in
-            ruleset.rule_positions.all()]
+        return self.get_rulesets([name])[name]
+
+    def get_rulesets(self, names):
+        """
+        Return a dict of the rules of each of the named rulesets. Rulesets,
+        positions, rules and table rules are loaded in two queries.
+        """
+        return dict(
+            (name, map(self.get_rule, rules))
+            for name, rules in self._ruleset_rules(names).iteritems())
+
+    def get_ruleset_definitions(self, names):
+        return dict(
+            (name, map(self.get_rule_definition, rules))
+            for name, rules in self._ruleset_rules(names).iteritems())
+
+    def _ruleset_rules(self, names):
+        """
+        Return a dict of the models.Rules of each of the named rulesets.
+        """
+        rulesets = dict(
+            (ruleset.pk, ruleset.name) for ruleset in
+            models.Ruleset.objects.filter(name__in=names))
+        missing = set(names) - set(rulesets.values())
+        if missing:
+            raise models.Ruleset.DoesNotExist(
+                'Ruleset(s) not found: {}'.format(', '.join(sorted(missing))))
+        result = dict((name, []) for name in rulesets.itervalues())
+        positions = models.RulePosition.objects.filter(
+            ruleset__in=rulesets.keys()).select_related('rule__tablerule')
+        for rule_pos in positions:
+            result[rulesets[rule_pos.ruleset_id]].append(rule_pos.rule)
+        return result
+
+    def get_rule_version(self, name):
+        return tuple(
+            models.Rule.objects.filter(slug=name).values_list(
+                'pk', 'updated_at'))
+
+    def get_ruleset_version(self, name):
+        return tuple(
+            models.RulePosition.objects.filter(ruleset__name=name)
+            .values_list('rule_id', 'priority', 'rule__updated_at'))
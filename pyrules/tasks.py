@@ -1,21 +1,82 @@
+import traceback
 from celery import task
-from . import RuleEngine, RuleStore, RuleContext
+from . import RuleContext
+from .worker import check_cache, get_engine, get_store
 
 
 @task
 def execute_rule(name, context):
     context = RuleContext(context)
-    engine = RuleEngine()
-    rule = RuleStore().get_rule(name)
+    check_cache()
+    rule = get_store().get_rule(name)
     return {
-        'result': engine.execute([rule], context).to_dict()}
+        'result': get_engine().execute([rule], context).to_dict(copy=False)}
 
 
 @task
 def execute_ruleset(name, context):
     context = RuleContext(context)
-    engine = RuleEngine()
-    ruleset = RuleStore().get_ruleset(name)
+    check_cache()
+    ruleset = get_store().get_ruleset(name)
     return {
-        'result': engine.execute(ruleset, context).to_dict()}
+        'result': get_engine().execute(ruleset, context).to_dict(copy=False)}
 
+
+@task
+def execute_rule_batch(name, contexts, task_ids=None):
+    """
+    Execute rule for each of the contexts, returns the list of results.
+
+    @param task_ids: ids to store the result of each context under, so
+        callers can wait for their own result (see pyrules.batching)
+    """
+    check_cache()
+    rule = get_store().get_rule(name)
+    return _execute_batch(execute_rule_batch, [rule], contexts, task_ids)
+
+
+@task
+def execute_ruleset_batch(name, contexts, task_ids=None):
+    """
+    Execute ruleset for each of the contexts, returns the list of results.
+
+    @param task_ids: ids to store the result of each context under, so
+        callers can wait for their own result (see pyrules.batching)
+    """
+    check_cache()
+    ruleset = get_store().get_ruleset(name)
+    return _execute_batch(execute_ruleset_batch, ruleset, contexts, task_ids)
+
+
+def _execute_batch(batch_task, ruleset, contexts, task_ids):
+    """
+    Execute ruleset for the contexts and store the results under task_ids.
+    If the batch fails, contexts are executed one by one, so each failure
+    is only stored for its own task id. Failed contexts are returned as
+    {'error': message}, errors are raised if there are no task ids.
+    """
+    engine = get_engine()
+    try:
+        results = [
+            {'result': context.to_dict(copy=False)}
+            for context in engine.execute_batch(ruleset, contexts)]
+    except Exception:
+        if not task_ids:
+            raise
+        results = []
+        for context in contexts:
+            try:
+                context = engine.execute(ruleset, RuleContext(context))
+            except Exception as exc:
+                results.append((exc, traceback.format_exc()))
+            else:
+                results.append({'result': context.to_dict(copy=False)})
+    backend = batch_task.backend
+    for task_id, result in zip(task_ids or (), results):
+        if isinstance(result, tuple):
+            backend.mark_as_failure(task_id, *result)
+        else:
+            backend.mark_as_done(task_id, result)
+    return [
+        {'error': unicode(result[0])} if isinstance(result, tuple)
+        else result for result in results]
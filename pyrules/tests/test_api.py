@@ -1,3 +1,5 @@
+import io
+import json
 import time
 from django.contrib.auth.models import User
 from django.db.models.loading import cache
@@ -5,6 +7,7 @@ from django.test import TestCase
 from django.test.client import Client
 from django.test.testcases import TransactionTestCase
 from tastypie.test import ResourceTestCase
+from ..rules import ConditionalRule
 
 
 class TransactionResourceTestCase(ResourceTestCase):
@@ -81,3 +84,76 @@ class ResourceTestCase(TransactionResourceTestCase):
         self.assertEqual(
             data['result'],
             {'first': 30, 'second': 3, 'double_first': 60, 'div_result': 10})
+
+    def test_ruleset_batch(self):
+        from ..api.resources import RulesetSyncResource
+        expected = [
+            {'result': {
+                'first': 30, 'second': 3, 'double_first': 60,
+                'div_result': 10}},
+            {'result': {
+                'first': 8, 'second': 2, 'double_first': 16,
+                'div_result': 4}}]
+        body = '{"first": 30, "second": 3}\n\n{"first": 8, "second": 2}\n'
+        for data in [body, json.dumps([
+                {'first': 30, 'second': 3}, {'first': 8, 'second': 2}])]:
+            response = self.client.post(
+                '/api/v1/ruleset/Sample/batch/', data=data,
+                content_type='application/x-ndjson')
+            self.assertHttpOK(response)
+            self.assertEqual(
+                response['Content-Type'], 'application/x-ndjson')
+            lines = ''.join(response.streaming_content).splitlines()
+            self.assertEqual([json.loads(line) for line in lines], expected)
+        # Bodies are read in chunks
+        read_size = RulesetSyncResource.READ_SIZE
+        RulesetSyncResource.READ_SIZE = 3
+        try:
+            contexts = [
+                {'first': 30, 'second': 3}, {'first': 8, 'second': 2}]
+            for data in [body, json.dumps(contexts),
+                         json.dumps(contexts, indent=4)]:
+                response = self.client.post(
+                    '/api/v1/ruleset/Sample/batch/', data=data,
+                    content_type='application/json')
+                lines = ''.join(response.streaming_content).splitlines()
+                self.assertEqual(
+                    [json.loads(line) for line in lines], expected)
+            # A compact array isn't read whole before its first item
+            stream = io.BytesIO(json.dumps(contexts * 10))
+            contexts = RulesetSyncResource._read_contexts(stream)
+            self.assertEqual(next(contexts), {'first': 30, 'second': 3})
+            self.assertLess(stream.tell(), 40)
+            self.assertEqual(len(list(contexts)), 19)
+            errors = []
+            for data in ['[{"first": 30, "second": 3}, {"first": 8',
+                         '[{"first": 30, "second": 3}] {"first": 8}']:
+                response = self.client.post(
+                    '/api/v1/ruleset/Sample/batch/', data=data,
+                    content_type='application/json')
+                lines = ''.join(response.streaming_content).splitlines()
+                self.assertEqual(json.loads(lines[0]), expected[0])
+                self.assertEqual(len(lines), 2)
+                errors.append(json.loads(lines[1])['error'])
+        finally:
+            RulesetSyncResource.READ_SIZE = read_size
+        self.assertIn('Extra data', errors[1])
+        # Results that can't be serialized are errors
+        rule = ConditionalRule(
+            condition=lambda rule, context: True,
+            action=lambda rule, context: {'obj': object()})
+        lines = list(RulesetSyncResource()._execute_batch(
+            [rule], iter([{'first': 1}])))
+        self.assertEqual(len(lines), 1)
+        self.assertIn('error', json.loads(lines[0]))
+        response = self.client.post(
+            '/api/v1/ruleset/Sample/batch/',
+            data='{"first": 30, "second": 3}\nnot json\n',
+            content_type='application/x-ndjson')
+        lines = ''.join(response.streaming_content).splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('error', json.loads(lines[1]))
+        response = self.client.post(
+            '/api/v1/ruleset/Missing/batch/', data='{}',
+            content_type='application/x-ndjson')
+        self.assertHttpNotFound(response)
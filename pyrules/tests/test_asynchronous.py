@@ -0,0 +1,51 @@
+import time
+import unittest
+from pyrules import ConditionalRule, RuleContext, SequencedRuleset
+from ..asynchronous import AsyncRuleEngine
+
+
+def slow_lookup(value):
+    def lookup(context):
+        time.sleep(0.2)
+        return value
+    return lookup
+
+
+class AsyncRuleEngineTest(unittest.TestCase):
+    def test_concurrent_lookups(self):
+        rules = [
+            ConditionalRule(
+                condition=lambda rule, context: context.rate > 1,
+                action=lambda rule, context: {
+                    'total': context.amount * context.rate},
+                lookups={'rate': slow_lookup(2)}),
+            SequencedRuleset([ConditionalRule(
+                condition=lambda rule, context: True,
+                action=lambda rule, context: {'name': context.user.upper()},
+                lookups={'user': slow_lookup('joe')})]),
+        ]
+        started = time.time()
+        context = AsyncRuleEngine().execute(rules, RuleContext({'amount': 3}))
+        self.assertLess(time.time() - started, 0.39)
+        self.assertEqual(context.total, 6)
+        self.assertEqual(context.name, 'JOE')
+
+    def test_existing_keys(self):
+        calls = []
+        rule = ConditionalRule(
+            condition=lambda rule, context: True,
+            action=lambda rule, context: {},
+            lookups={'rate': lambda context: calls.append(1)})
+        context = AsyncRuleEngine().execute([rule], RuleContext({'rate': 1}))
+        self.assertEqual(calls, [])
+        self.assertEqual(context.rate, 1)
+
+    def test_error(self):
+        def fail(context):
+            raise ValueError('unavailable')
+        rule = ConditionalRule(
+            condition=lambda rule, context: True,
+            action=lambda rule, context: {},
+            lookups={'rate': fail})
+        with self.assertRaises(ValueError):
+            AsyncRuleEngine().execute([rule], RuleContext())
@@ -0,0 +1,96 @@
+import time
+from django.test import TestCase
+from django.test.utils import override_settings
+from .. import batching, models
+from ..batching import BatchAggregator, get_aggregator
+from ..tasks import execute_rule_batch, execute_ruleset_batch
+
+
+class RecordingTask(object):
+    name = 'recording'
+
+    def __init__(self):
+        self.sent = []
+
+    def apply_async(self, args):
+        self.sent.append(args)
+
+    def AsyncResult(self, task_id):
+        return task_id
+
+
+class RecordingBackend(object):
+    def __init__(self):
+        self.done = {}
+        self.failed = {}
+
+    def mark_as_done(self, task_id, result):
+        self.done[task_id] = result
+
+    def mark_as_failure(self, task_id, exc, traceback=None):
+        self.failed[task_id] = exc
+
+
+class BatchAggregatorTest(TestCase):
+    def test_size(self):
+        batch_task = RecordingTask()
+        aggregator = BatchAggregator(batch_task, size=3, window=60)
+        ids = [aggregator.add('rule', {'value': i}) for i in xrange(4)]
+        self.assertEqual(len(set(ids)), 4)
+        self.assertEqual(batch_task.sent, [
+            ['rule', [{'value': 0}, {'value': 1}, {'value': 2}], ids[:3]]])
+        aggregator.flush()
+        self.assertEqual(batch_task.sent[1], ['rule', [{'value': 3}], ids[3:]])
+        self.assertEqual(aggregator._timers, {})
+
+    def test_window(self):
+        batch_task = RecordingTask()
+        aggregator = BatchAggregator(batch_task, size=10, window=0.05)
+        first = aggregator.add('a', {'value': 1})
+        second = aggregator.add('b', {'value': 2})
+        self.assertEqual(batch_task.sent, [])
+        time.sleep(0.2)
+        self.assertEqual(
+            sorted(batch_task.sent),
+            [['a', [{'value': 1}], [first]], ['b', [{'value': 2}], [second]]])
+
+    def test_settings(self):
+        self.assertIs(get_aggregator(execute_rule_batch), None)
+        with override_settings(PYRULES_BATCH_SIZE=20):
+            aggregator = get_aggregator(execute_rule_batch)
+            self.assertEqual(aggregator.size, 20)
+            self.assertIs(get_aggregator(execute_rule_batch), aggregator)
+        batching._aggregators.clear()
+
+    def test_batch_tasks(self):
+        trule = models.TableRule.objects.create(
+            name='Double', slug='double',
+            tablerule_format=models.TableRule.TF_JSON,
+            definition='{"rules": [{"if": [{"value__gt": 1}], '
+                       '"then": ["context.value * 2"], '
+                       '"target": ["double"]}]}')
+        ruleset = models.Ruleset.objects.create(name='Doubles')
+        models.RulePosition.objects.create(
+            rule=trule, ruleset=ruleset, priority=1)
+        contexts = [{'value': 1}, {'value': 3}]
+        expected = [
+            {'result': {'value': 1}},
+            {'result': {'value': 3, 'double': 6}}]
+        self.assertEqual(execute_rule_batch('double', contexts), expected)
+        self.assertEqual(
+            execute_ruleset_batch('Doubles', contexts), expected)
+        # A failing context only fails its own task
+        original = execute_rule_batch.backend
+        backend = execute_rule_batch.backend = RecordingBackend()
+        try:
+            results = execute_rule_batch(
+                'double', contexts + [{'value': {'a': 1}}], ['a', 'b', 'c'])
+        finally:
+            execute_rule_batch.backend = original
+        self.assertEqual(results[:2], expected)
+        self.assertIn('error', results[2])
+        self.assertEqual(backend.done, {'a': expected[0], 'b': expected[1]})
+        self.assertIsInstance(backend.failed['c'], TypeError)
+        with self.assertRaises(TypeError):
+            execute_rule_batch('double', [{'value': {'a': 1}}])
+
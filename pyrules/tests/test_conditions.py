@@ -1,6 +1,11 @@
+import pickle
+import random
+import threading
 from unittest import TestCase
+from pyparsing import ParseException
 from ..conditions import LogicEvaluator, C, boolExpr, ExpressionHandler
-from ..conditions import ExpressionError
+from ..conditions import parse_logic_tree
+from ..conditions import ConditionMemo, ExpressionError
 
 
 class SampleObj(object):
@@ -66,6 +71,39 @@ class ExpressionHandlerTestCase(TestCase):
             e.evaluate(
                 'sample__sub__a_dict__foo__icontains', {'sample': sample}, 'a'))
 
+    def test_path(self):
+        e = ExpressionHandler()
+        path = e.path('user__age__gte')
+        self.assertIs(e.path('user__age__gte'), path)
+        self.assertEqual(path.root, 'user')
+        self.assertEqual(path.bits, ['age', 'gte'])
+        self.assertTrue(path.evaluate({'user': {'age': 20}}, 18))
+        self.assertFalse(path.evaluate({'user': {'age': 16}}, 18))
+        # Keys take precedence over operators of the same name
+        self.assertTrue(path.evaluate({'user': {'age': {'gte': 5}}}, 5))
+        with self.assertRaises(ExpressionError):
+            path.evaluate({'user': {}}, 18)
+
+    def test_modes(self):
+        sample = SampleObj()
+        self.assertEqual(
+            ExpressionHandler.mode({}, 'foo'), ExpressionHandler.ITEM)
+        self.assertEqual(
+            ExpressionHandler.mode({}, 'items'), ExpressionHandler.PROBE)
+        self.assertEqual(
+            ExpressionHandler.mode(10, 'gt'), ExpressionHandler.NONE)
+        self.assertEqual(
+            ExpressionHandler.mode('foo', 'contains'), ExpressionHandler.NONE)
+        self.assertEqual(
+            ExpressionHandler.mode(sample, 'foo'), ExpressionHandler.PROBE)
+        # Instance attributes are probed on every object
+        e = ExpressionHandler()
+        sample.sub = SampleObj()
+        self.assertTrue(
+            e.evaluate('sample__sub__a_num', {'sample': sample}, 10))
+        with self.assertRaises(ExpressionError):
+            e.evaluate('sample__sub__a_num', {'sample': SampleObj()}, 10)
+
     
 class CTestCase(TestCase):
     def test_clone(self):
@@ -108,6 +146,25 @@ class CTestCase(TestCase):
                         (~C(c1=True) ^ (C(c2=True) | C(c3=True))).apply(
                             {'c1': c1, 'c2': c2, 'c3': c3}),
                         (not c1) ^ (c2 | c3))
+                    self.assertEqual(
+                        (~(C(c1=True) & C(c2=True))).apply(
+                            {'c1': c1, 'c2': c2}),
+                        not (c1 and c2))
+
+    def test_compile(self):
+        exprs = [
+            C(c1=True), ~C(c1=True), C(c1=True) & ~C(c2=True),
+            ~(C(c1=True) | C(c2=True)) ^ C(c3=True),
+            ~C(c1=True) ^ (C(c2=True) | C(c3=True)),
+            C(c1__bool=False, c2=True) | ~(C(c3=True) & C(c1=True))]
+        for expr in exprs:
+            compiled = expr.compile()
+            for c1 in (True, False):
+                for c2 in (True, False):
+                    for c3 in (True, False):
+                        context = {'c1': c1, 'c2': c2, 'c3': c3}
+                        self.assertEqual(
+                            compiled(context), expr.apply(context))
 
     def test_negation(self):
         self.assertNotEqual(~C('foo', 'bar'), C('foo', 'bar'))
@@ -198,6 +255,47 @@ class LogicEvaluatorTestCase(TestCase):
             boolExpr.parseString('1 & ~(2 | 3)').asList(),
             [['1', '&', ['~', ['2', '|', '3']]]])
 
+    def test_fast_parser(self):
+        rnd = random.Random(1)
+
+        def logic(depth):
+            choice = rnd.randint(0, 3 if depth else 0)
+            if choice == 0:
+                return str(rnd.randint(1, 12))
+            elif choice == 1:
+                return '~' + logic(depth - 1)
+            elif choice == 2:
+                return '({})'.format(logic(depth - 1))
+            return '{} {} {}'.format(
+                logic(depth - 1), rnd.choice('&|^'), logic(depth - 1))
+
+        for i in xrange(100):
+            text = logic(3)
+            expected = boolExpr.parseString(text)[0]
+            if not isinstance(expected, basestring):
+                expected = expected.asList()
+            self.assertEqual(parse_logic_tree(text), expected, text)
+        for text in ['', '1 &', '(1', '1 2', 'a', '1 & 2 )']:
+            self.assertEqual(parse_logic_tree(text), None)
+
+    def test_parse_fallback(self):
+        # pyparsing ignores trailing tokens
+        self.assertEqual(
+            LogicEvaluator('1 & 2 )', ['foo', 'bar']).logic,
+            C(cond1=True) & C(cond2=True))
+        with self.assertRaises(ParseException):
+            LogicEvaluator('& 1', ['foo'])
+
+    def test_parse_validate(self):
+        LogicEvaluator._parsed.clear()
+        LogicEvaluator.validate_logic = True
+        try:
+            e = LogicEvaluator('~(1 | 2) ^ 3', ['foo', 'bar', 'baz'])
+        finally:
+            LogicEvaluator.validate_logic = False
+        self.assertEqual(
+            e.logic, ~(C(cond1=True) | C(cond2=True)) ^ C(cond3=True))
+
     def test_to_c_expressions(self):
         self.assertEqual(LogicEvaluator.to_c_expression('1'), C(cond1=True))
         self.assertEqual(
@@ -242,6 +340,116 @@ class LogicEvaluatorTestCase(TestCase):
         self.assertEqual(
             e.evaluate({'foo': False, 'bar': False}), False)
 
+    def test_short_circuit(self):
+        # Conditions not needed for the result aren't evaluated, so the
+        # missing 'bar' doesn't raise.
+        e = LogicEvaluator('1 | 2', ['foo', 'bar'])
+        self.assertEqual(e.evaluate({'foo': True}), True)
+        with self.assertRaises(ExpressionError):
+            e.evaluate({'foo': False})
+        e = LogicEvaluator('~1 & 2', ['foo', {'bar__gt': 1, 'baz': 2}])
+        self.assertEqual(e.evaluate({'foo': True}), False)
+        self.assertEqual(
+            e.evaluate({'foo': False, 'bar': 2, 'baz': 2}), True)
+        self.assertEqual(
+            e.evaluate({'foo': False, 'bar': 2, 'baz': 3}), False)
+
+    def test_fold(self):
+        e = LogicEvaluator('~1 | 2 & 3', ['foo', 'bar', {'baz__gt': 1}])
+        self.assertEqual(
+            e.fold(
+                lambda expression, value: '{}={}'.format(expression, value),
+                lambda op, left, right: '({} {} {})'.format(left, op, right),
+                lambda value: '~' + value),
+            '(~foo=True OR (bar=True AND baz__gt=1))')
+
+    def test_adaptive(self):
+        rnd = random.Random(0)
+        contexts = [
+            {'a': 1, 'b': rnd.choice([0, 1, 1, 1]),
+             'c': rnd.choice([0, 0, 0, 1]), 'd': rnd.choice([0, 1])}
+            for i in xrange(50)]
+        logic = '1 & (2 & 3) & ~(4 | 1)'
+        conditions = [{'a': 1}, {'b': 1}, {'c': 1}, {'d': 1}]
+        e = LogicEvaluator(logic, conditions, adaptive=True)
+        e.SAMPLE_SIZE = 10
+        plain = LogicEvaluator(logic, conditions)
+        for context in contexts:
+            self.assertEqual(e.evaluate(context), plain.evaluate(context))
+        self.assertEqual(e.stats['cond1'][:2], [10, 10])
+        # Conditions likely to be false go first in &, true ones in |
+        e.set_stats({'conditions': {
+            'cond1': [10, 10, 1.0], 'cond2': [9, 10, 1.0],
+            'cond3': [3, 10, 1.0], 'cond4': [5, 10, 1.0]}})
+        self.assertEqual(
+            e.logic, plain.parse_logic('~(1 | 4) & 3 & 2 & 1'))
+        # Statistics are restored with the order
+        restored = LogicEvaluator(logic, conditions, adaptive=True)
+        restored.set_stats(e.get_stats())
+        self.assertEqual(restored.logic, e.logic)
+        self.assertEqual(pickle.loads(pickle.dumps(e)).logic, e.logic)
+        self.assertFalse(plain.reorder())
+
+    def test_adaptive_guard(self):
+        # 1 guards 2, reordering to '2 & 1' must not make valid input raise
+        conditions = [{'user__bool': True}, {'user__age__gt': 18}]
+        e = LogicEvaluator('1 & 2', conditions, adaptive=True)
+        for i in xrange(e.SAMPLE_SIZE):
+            self.assertFalse(e.evaluate({'user': {'age': 10}}))
+        self.assertEqual(e.logic, e.parse_logic('2 & 1'))
+        plain = LogicEvaluator('1 & 2', conditions)
+        self.assertFalse(plain.evaluate({'user': None}))
+        self.assertFalse(e.evaluate({'user': None}))
+        self.assertEqual(e.logic, e.parse_logic('1 & 2'))
+        self.assertEqual(e.get_stats()['unsafe'], ['cond2'])
+        self.assertFalse(e.reorder())
+        self.assertFalse(e.evaluate({'user': None}, ConditionMemo()))
+
+    def test_adaptive_threads(self):
+        # Evaluators are shared by threads, one may evaluate while another
+        # restores the original logic
+        conditions = [{'user__bool': True}, {'user__age__gt': 18}]
+        compiling = threading.Event()
+        go = threading.Event()
+
+        class PausingEvaluator(LogicEvaluator):
+            paused = False
+
+            def compile(self, *args, **kwargs):
+                if self.paused:
+                    compiling.set()
+                    go.wait(5)
+                return LogicEvaluator.compile(self, *args, **kwargs)
+
+        e = PausingEvaluator('1 & 2', conditions, adaptive=True)
+        e.set_stats({'conditions': {
+            'cond1': [90, 100, 0.1], 'cond2': [10, 100, 0.001]}})
+        self.assertEqual(e.logic, e.parse_logic('2 & 1'))
+        e.paused = True
+        results = []
+        thread = threading.Thread(
+            target=lambda: results.append(e.evaluate({'user': None})))
+        thread.start()
+        while thread.is_alive() and not compiling.is_set():
+            thread.join(0.01)
+        try:
+            self.assertFalse(e.evaluate({'user': None}))
+        finally:
+            go.set()
+            thread.join()
+        self.assertEqual(results, [False])
+        self.assertEqual(e.logic, e.parse_logic('1 & 2'))
+
+    def test_adaptive_unsafe(self):
+        # 2 raises unless 1 is true, so the chain keeps its order
+        e = LogicEvaluator('1 & 2', ['ok', {'value__gt': 5}], adaptive=True)
+        e.SAMPLE_SIZE = 10
+        for i in xrange(20):
+            context = {'ok': i > 0, 'value': 0} if i else {'ok': False}
+            self.assertFalse(e.evaluate(context))
+        self.assertEqual(e.get_stats()['unsafe'], ['cond2'])
+        self.assertEqual(e.logic._expr[1], ('cond1', True, False))
+
 
 '''
 class ConditionsTestCase(TestCase):
@@ -0,0 +1,123 @@
+import random
+import unittest
+from pyrules import (
+    ConditionalRule, ExecutionTrace, RuleContext, RuleEngine,
+    SequencedRuleset, TableRule)
+from ..dependencies import DependencyGraph, action_keys, rule_keys
+
+
+def table(name, condition, action, target):
+    return TableRule(
+        [{'if': [condition], 'then': [action], 'target': [target]}],
+        name=name)
+
+
+class DependencyTest(unittest.TestCase):
+    def setUp(self):
+        self.rules = [
+            table('A', {'amount__gt': 10}, 'context.amount * 2', 'double'),
+            table('B', {'country': 'CH'}, '"CHF"', 'currency'),
+            table('C', {'double__gt': 50}, 'context.currency', 'label'),
+            table('D', {'vip': True}, '0', 'amount'),
+        ]
+
+    def test_action_keys(self):
+        self.assertEqual(
+            action_keys('context.a + context["b"] * 2'), set(['a', 'b']))
+        self.assertEqual(action_keys('5'), set())
+        self.assertEqual(action_keys(5), set())
+        self.assertEqual(action_keys('len(context)'), None)
+        self.assertEqual(action_keys('context._executed'), None)
+        self.assertEqual(action_keys('len(context.to_dict())'), None)
+        self.assertEqual(action_keys('context.update({"a": 1})'), None)
+        self.assertEqual(action_keys('context.as_dict'), None)
+        self.assertEqual(action_keys('context.handler(5)'), None)
+        self.assertEqual(action_keys('context["handler"](5)'), None)
+
+    def test_rule_keys(self):
+        self.assertEqual(
+            rule_keys(self.rules[2]), (set(['double', 'currency']),
+                                       set(['label'])))
+        self.assertEqual(
+            rule_keys(SequencedRuleset(self.rules[:2])),
+            (set(['amount', 'country']), set(['double', 'currency'])))
+        rule = ConditionalRule(lambda r, c: True, lambda r, c: {})
+        self.assertEqual(rule_keys(rule), (None, None))
+
+    def test_graph(self):
+        graph = DependencyGraph(self.rules)
+        self.assertEqual(graph.levels(), [[0, 1], [2, 3]])
+        self.assertEqual(graph.affected(['country']), [1, 2])
+        self.assertEqual(graph.affected(['vip']), [3])
+        self.assertEqual(graph.affected(['amount']), [0, 2, 3])
+        opaque = ConditionalRule(lambda r, c: True, lambda r, c: {})
+        graph = DependencyGraph([self.rules[0], opaque, self.rules[1]])
+        self.assertEqual(graph.levels(), [[0], [1], [2]])
+        self.assertEqual(graph.affected(['vip']), [1, 2])
+
+    def test_skip_unchanged(self):
+        rnd = random.Random(7)
+        engine = RuleEngine()
+        plain = SequencedRuleset(self.rules)
+        skipping = SequencedRuleset(self.rules, skip_unchanged=True)
+        expected = RuleContext({'amount': 30, 'country': 'CH'})
+        context = RuleContext({'amount': 30, 'country': 'CH'})
+        for i in xrange(50):
+            engine.execute([plain], expected)
+            engine.execute([skipping], context)
+            self.assertEqual(context.to_dict(), expected.to_dict())
+            key, values = rnd.choice([
+                ('amount', [5, 20, 40]), ('country', ['CH', 'DE']),
+                ('vip', [True, False]), ('label', ['x'])])
+            value = rnd.choice(values)
+            expected[key] = context[key] = value
+
+    def test_skip_trace(self):
+        ruleset = SequencedRuleset(self.rules, skip_unchanged=True)
+        context = RuleContext({'amount': 30, 'country': 'DE'})
+        RuleEngine().execute([ruleset], context)
+        context.country = 'CH'
+        context._executed = ExecutionTrace()
+        RuleEngine().execute([ruleset], context)
+        self.assertEqual(
+            [ruleid for ruleid, _result in context._executed],
+            ['B.1', 'B', 'C.1', 'C', 'SequencedRuleset'])
+
+    def test_skip_methods(self):
+        # Actions calling context methods can't be analysed
+        rules = [
+            table('N', {'amount__gt': 0}, 'len(context.to_dict())', 'n'),
+            table('U', {'amount__gt': 0},
+                  'context.update({"seen": context.amount}) or 1', 'updated')]
+        engine = RuleEngine()
+        plain = SequencedRuleset(rules)
+        skipping = SequencedRuleset(rules, skip_unchanged=True)
+        expected = RuleContext({'amount': 30})
+        context = RuleContext({'amount': 30})
+        for key, value in [(None, None), ('extra', 1), ('seen', None)]:
+            if key is not None:
+                expected[key] = context[key] = value
+            engine.execute([plain], expected)
+            engine.execute([skipping], context)
+            self.assertEqual(context.to_dict(), expected.to_dict())
+        self.assertEqual((context.n, context.seen), (5, 30))
+
+    def test_skip_opaque(self):
+        # Rules after a rule that can't be analysed always run
+        opaque = ConditionalRule(
+            lambda rule, context: True,
+            lambda rule, context: {'double': context.amount * 3})
+        ruleset = SequencedRuleset(
+            [self.rules[1], opaque, self.rules[2]], skip_unchanged=True)
+        context = RuleContext({'amount': 30, 'country': 'CH'})
+        RuleEngine().execute([ruleset], context)
+        self.assertEqual(context.label, 'CHF')
+        context.amount = 10
+        context.country = 'DE'
+        context.label = None
+        context._executed = ExecutionTrace()
+        RuleEngine().execute([ruleset], context)
+        self.assertEqual(
+            [ruleid for ruleid, _result in context._executed],
+            ['B', 'ConditionalRule', 'C', 'SequencedRuleset'])
+        self.assertEqual((context.double, context.label), (30, None))
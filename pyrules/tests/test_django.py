@@ -1,7 +1,12 @@
+import cPickle as pickle
 from django.contrib.auth.models import User
 from django.test import TestCase
 from django.test.client import Client
-from .. import models, rules, storage
+from .. import artifacts, models, rules, storage
+from .. import RuleContext, RuleEngine
+from ..cache import RuleCache
+from ..conditions import LogicEvaluator
+from ..storages.django import DjangoStorage
 
 
 class DjangoAppTestCase(TestCase):
@@ -98,3 +103,169 @@ rules:
         self.assertEqual(ruleset[0].rules, trule_obj.rules)
         self.assertEqual(ruleset[0].name, trule_obj.name)
         self.assertEqual(ruleset[1].name, rule_obj.name)
+
+    def test_rule_cache(self):
+        trule = models.TableRule.objects.create(
+            name='Cached', slug='cached',
+            tablerule_format=models.TableRule.TF_JSON,
+            definition='{"rules": [{"if": [true], "then": [1], '
+                       '"target": ["foo"]}]}')
+        ruleset = models.Ruleset.objects.create(name='CachedRuleset')
+        models.RulePosition.objects.create(
+            rule=trule, ruleset=ruleset, priority=100)
+        cache = RuleCache(max_size=2)
+        store = storage.RuleStore(cache=cache)
+        rule_obj = store.get_rule('cached')
+        rules_obj = store.get_ruleset('CachedRuleset')
+        self.assertIs(store.get_rule('cached'), rule_obj)
+        # Only the version is checked for cached rules
+        with self.assertNumQueries(1):
+            self.assertIs(store.get_ruleset('CachedRuleset'), rules_obj)
+        self.assertEqual(
+            cache.stats(), {'hits': 2, 'misses': 2, 'stale': 0, 'size': 2})
+        # Changes are picked up
+        trule.definition = trule.definition.replace('1', '2')
+        trule.save()
+        rule_obj = store.get_rule('cached')
+        self.assertEqual(rule_obj.rules[0]['then'], [2])
+        self.assertEqual(
+            store.get_ruleset('CachedRuleset')[0].rules[0]['then'], [2])
+        self.assertEqual(cache.stale, 2)
+        self.assertIs(store.get_rule('cached'), rule_obj)
+        models.RulePosition.objects.all().delete()
+        self.assertEqual(store.get_ruleset('CachedRuleset'), [])
+        # The least recently used entry is dropped
+        self.assertEqual(len(cache._entries), 2)
+        cache.invalidate()
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_ruleset_queries(self):
+        ruleset = models.Ruleset.objects.create(name='Big')
+        other = models.Ruleset.objects.create(name='Other')
+        for i in xrange(20):
+            rule = models.Rule.objects.create(
+                name='Rule{}'.format(i), slug='rule{}'.format(i),
+                source='pyrules.rules.Rule')
+            trule = models.TableRule.objects.create(
+                name='Table{}'.format(i), slug='table{}'.format(i),
+                tablerule_format=models.TableRule.TF_JSON,
+                definition='{"rules": [{"if": [true], "then": [%d], '
+                           '"target": ["foo"]}]}' % i)
+            models.RulePosition.objects.create(
+                rule=rule, ruleset=ruleset, priority=2 * i)
+            models.RulePosition.objects.create(
+                rule=trule, ruleset=ruleset, priority=2 * i + 1)
+            models.RulePosition.objects.create(
+                rule=trule, ruleset=other, priority=i)
+        store = DjangoStorage()
+        with self.assertNumQueries(2):
+            rules_obj = store.get_ruleset('Big')
+        self.assertEqual(len(rules_obj), 40)
+        self.assertEqual(rules_obj[0].rules[0]['then'], [19])
+        self.assertEqual(rules_obj[1].name, 'Rule19')
+        with self.assertNumQueries(2):
+            rulesets = store.get_rulesets(['Big', 'Other'])
+        self.assertEqual(
+            [rule_obj.name for rule_obj in rulesets['Big']],
+            [rule_obj.name for rule_obj in rules_obj])
+        self.assertEqual(
+            [rule_obj.rules[0]['then'] for rule_obj in rulesets['Other']],
+            [[i] for i in reversed(xrange(20))])
+        with self.assertRaises(models.Ruleset.DoesNotExist):
+            store.get_rulesets(['Big', 'Missing'])
+
+    def test_artifacts(self):
+        trule = models.TableRule.objects.create(
+            name='Compiled', slug='compiled',
+            tablerule_format=models.TableRule.TF_YAML,
+            definition='ruleset: Compiled\nrules:\n'
+                       '  - if: {logic: "1 | ~2", conditions: [foo, bar]}\n'
+                       '    then: [context.baz * 2]\n'
+                       '    target: [baz]\n')
+        trule = models.TableRule.objects.get(pk=trule.pk)
+        self.assertTrue(trule.compiled)
+        # The artifact is loaded without parsing the definition or
+        # compiling the logic and actions
+        from_yaml = rules.TableRule.from_yaml
+        compile_logic = LogicEvaluator.compile
+        rules.TableRule.from_yaml = None
+        LogicEvaluator.compile = None
+        rules.compile = None
+        try:
+            rule_obj = trule.load_rule()
+        finally:
+            rules.TableRule.from_yaml = from_yaml
+            LogicEvaluator.compile = compile_logic
+            del rules.compile
+        self.assertEqual(rule_obj.name, 'Compiled')
+        self.assertEqual(
+            rule_obj._evaluators[0].logic,
+            trule.load_rule()._evaluators[0].logic)
+        context = RuleContext({'foo': False, 'bar': False, 'baz': 2})
+        RuleEngine().execute([rule_obj], context)
+        self.assertEqual(context.baz, 4)
+        # Stale artifacts are rebuilt
+        self.assertEqual(
+            artifacts.loads(trule.compiled, trule.definition + ' ', 1), None)
+        models.TableRule.objects.filter(pk=trule.pk).update(
+            compiled=artifacts.dumps(rule_obj, 'other', 1))
+        trule = models.TableRule.objects.get(pk=trule.pk)
+        self.assertEqual(trule.load_rule().name, 'Compiled')
+        self.assertEqual(
+            bytes(models.TableRule.objects.get(pk=trule.pk).compiled),
+            bytes(trule.compiled))
+        self.assertTrue(artifacts.loads(
+            trule.compiled, trule.definition, trule.tablerule_format))
+        # Artifacts of classes that no longer exist are rebuilt
+        corrupted = pickle.dumps((
+            artifacts.FORMAT_VERSION, artifacts.PYTHON_MAGIC,
+            artifacts.checksum(trule.definition, trule.tablerule_format),
+            'cpyrules.rules\nRemovedRule\n(tR.'))
+        self.assertEqual(artifacts.loads(
+            corrupted, trule.definition, trule.tablerule_format), None)
+        models.TableRule.objects.filter(pk=trule.pk).update(
+            compiled=corrupted)
+        trule = models.TableRule.objects.get(pk=trule.pk)
+        self.assertEqual(trule.load_rule().name, 'Compiled')
+        self.assertNotEqual(
+            bytes(models.TableRule.objects.get(pk=trule.pk).compiled),
+            corrupted)
+        # Definitions are hashed as UTF-8, bytes as they are
+        definition = u'rules: []\n# \xe9t\xe9\n'
+        self.assertEqual(
+            artifacts.checksum(definition.encode('utf-8'), 1),
+            artifacts.checksum(definition, 1))
+
+    def test_condition_stats(self):
+        trule = models.TableRule.objects.create(
+            name='Adaptive', slug='adaptive',
+            tablerule_format=models.TableRule.TF_JSON,
+            definition='{"adaptive": true, "rules": [{"if": ["foo", "bar"], '
+                       '"then": [1], "target": ["baz"]}]}')
+        rule_obj = trule.load_rule()
+        evaluator = rule_obj._evaluators[0]
+        evaluator.SAMPLE_SIZE = 5
+        for i in xrange(5):
+            evaluator.evaluate({'foo': True, 'bar': False})
+        trule.save_condition_stats(rule_obj)
+        updated_at = trule.updated_at
+        trule = models.TableRule.objects.get(pk=trule.pk)
+        self.assertEqual(trule.updated_at, updated_at)
+        # Loaded rules start with the saved order
+        self.assertEqual(
+            trule.load_rule()._evaluators[0].logic, evaluator.logic)
+        self.assertEqual(evaluator.logic, evaluator.parse_logic('2 & 1'))
+
+        # Saving keeps them, changing the definition drops them
+        trule.name = 'Adaptive rule'
+        trule.save()
+        self.assertTrue(
+            models.TableRule.objects.get(pk=trule.pk).condition_stats)
+        trule.definition = trule.definition.replace(
+            '["foo", "bar"]', '["bar", "foo"]')
+        trule.save()
+        trule = models.TableRule.objects.get(pk=trule.pk)
+        self.assertEqual(trule.condition_stats, '')
+        self.assertEqual(
+            trule.load_rule()._evaluators[0].logic,
+            evaluator.parse_logic('1 & 2'))
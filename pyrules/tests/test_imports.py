@@ -0,0 +1,41 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+SCRIPT = """
+import json, sys, time
+started = time.time()
+import pyrules
+from pyrules import ConditionalRule, RuleContext, RuleEngine
+elapsed = time.time() - started
+print(json.dumps({'elapsed': elapsed, 'modules': sorted(
+    name for name, module in sys.modules.items() if module)}))
+"""
+
+# Seconds allowed for importing pyrules in a fresh interpreter
+IMPORT_BUDGET = 0.25
+
+
+class ImportTest(unittest.TestCase):
+    def run_script(self):
+        env = dict(os.environ)
+        env.pop('DJANGO_SETTINGS_MODULE', None)
+        output = subprocess.check_output(
+            [sys.executable, '-c', SCRIPT], cwd=ROOT, env=env)
+        return json.loads(output.decode('utf-8'))
+
+    def test_lazy_imports(self):
+        modules = set(
+            name.split('.')[0] for name in self.run_script()['modules'])
+        for name in ('django', 'yaml', 'pyparsing', 'multiprocessing'):
+            self.assertNotIn(name, modules)
+
+    def test_import_budget(self):
+        elapsed = min(self.run_script()['elapsed'] for i in xrange(3))
+        self.assertLess(elapsed, IMPORT_BUDGET)
@@ -0,0 +1,72 @@
+import random
+import unittest
+from pyrules import RuleContext, RuleEngine, TableRule
+from ..index import RowIndex, split_expression
+
+
+COUNTRIES = ['CH', 'DE', 'FR', 'IT']
+PRODUCTS = ['basic', 'plus', 'premium']
+
+
+def make_rows(count, rnd):
+    rows = []
+    for i in xrange(count):
+        conditions = [
+            {'country': rnd.choice(COUNTRIES)},
+            {'product__eq': rnd.choice(PRODUCTS)},
+            {'amount__' + rnd.choice(['gt', 'gte', 'lt', 'lte']):
+             rnd.randint(0, 100)}]
+        logic = rnd.choice([None, '1 & 2 & 3', '1 & (2 | 3)', '~1 & 3'])
+        rows.append({
+            'rule': 'row{}'.format(i),
+            'if': {'logic': logic, 'conditions': conditions},
+            'then': ['context.amount + {}'.format(i)],
+            'target': ['total']})
+    # Rows writing to indexed fields
+    rows.insert(count // 2, {
+        'if': [{'country': 'CH'}, {'amount__lt': 50}],
+        'then': ['"DE"'], 'target': ['country']})
+    return rows
+
+
+class RowIndexTest(unittest.TestCase):
+    def test_split_expression(self):
+        self.assertEqual(split_expression('foo'), ('foo', None))
+        self.assertEqual(split_expression('foo__bar'), ('foo__bar', None))
+        self.assertEqual(split_expression('foo__eq'), ('foo', 'eq'))
+        self.assertEqual(
+            split_expression('foo__bar__gte'), ('foo__bar', 'gte'))
+        self.assertEqual(split_expression('foo__neq'), None)
+
+    def test_candidates(self):
+        trule = TableRule([
+            {'if': [{'country': 'CH'}], 'then': [1], 'target': ['a']},
+            {'if': [{'country': 'DE'}], 'then': [2], 'target': ['a']},
+            {'if': [{'amount__gt': 10}], 'then': [3], 'target': ['b']},
+            {'if': [{'amount__gt': 20}], 'then': [4], 'target': ['b']},
+        ])
+        index = RowIndex(trule._evaluators)
+        self.assertEqual(
+            index.candidates({'country': 'CH', 'amount': 15}), [0, 2])
+        self.assertEqual(
+            index.candidates({'country': 'FR', 'amount': 25}), [2, 3])
+        self.assertEqual(
+            index.candidates({'country': 'FR', 'amount': 25}, 3), [3])
+        # Unresolvable fields are left to the evaluator
+        self.assertEqual(index.candidates({}), [0, 1, 2, 3])
+
+    def test_same_results(self):
+        rnd = random.Random(42)
+        rows = make_rows(300, rnd)
+        linear = TableRule(rows, name='Table')
+        indexed = TableRule(rows, name='Table', indexed=True)
+        engine = RuleEngine()
+        for i in xrange(100):
+            data = {
+                'country': rnd.choice(COUNTRIES + ['XX']),
+                'product': rnd.choice(PRODUCTS),
+                'amount': rnd.randint(0, 100)}
+            expected = engine.execute([linear], RuleContext(data))
+            context = engine.execute([indexed], RuleContext(data))
+            self.assertEqual(context.to_dict(), expected.to_dict())
+            self.assertEqual(context._executed, expected._executed)
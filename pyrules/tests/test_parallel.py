@@ -0,0 +1,29 @@
+import pickle
+import unittest
+from pyrules import ParallelRuleEngine, RuleContext, RuleEngine, TableRule
+
+
+class ParallelRuleEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.ruleset = [TableRule([
+            {'if': [{'value__gt': 10}], 'then': ['context.value * 2'],
+             'target': ['double']},
+            {'if': [{'value__lte': 10}], 'then': ['context.value - 1'],
+             'target': ['less']},
+        ], name='Table', indexed=True)]
+        self.records = [{'value': i} for i in xrange(50)]
+
+    def test_pickle(self):
+        trule = pickle.loads(pickle.dumps(self.ruleset[0]))
+        self.assertEqual(trule.rules, self.ruleset[0].rules)
+        self.assertEqual(trule.ruleid, 'Table')
+        self.assertTrue(trule._index is not None)
+
+    def test_execute_batch(self):
+        engine = ParallelRuleEngine(processes=2, chunksize=7)
+        contexts = engine.execute_batch(self.ruleset, self.records)
+        self.assertEqual(len(contexts), len(self.records))
+        for record, context in zip(self.records, contexts):
+            expected = RuleEngine().execute(self.ruleset, RuleContext(record))
+            self.assertEqual(context.to_dict(), expected.to_dict())
+            self.assertEqual(context._executed, expected._executed)
@@ -0,0 +1,95 @@
+import unittest
+from pyrules import (
+    ConditionalRule, RuleContext, RuleEngine, SequencedRuleset, TableRule)
+from ..profiling import Profiler
+
+
+class ProfilerTest(unittest.TestCase):
+    def setUp(self):
+        self.table = TableRule([
+            {'rule': 'big', 'if': [{'amount__gt': 10}, {'vip': True}],
+             'then': ['context.amount * 2'], 'target': ['double']},
+            {'if': {'logic': '1 | 2', 'conditions': [
+                {'amount__lte': 10}, {'missing__gt': 1}]},
+             'then': ['1'], 'target': ['small']},
+        ], name='Table', indexed=True)
+        self.ruleset = [SequencedRuleset([
+            ConditionalRule(
+                condition=lambda rule, context: True,
+                action=lambda rule, context: {'vip': context.amount > 5}),
+            self.table,
+        ])]
+
+    def test_same_results(self):
+        profiler = Profiler()
+        engine = RuleEngine(profiler=profiler)
+        for amount in (5, 20, 8):
+            expected = RuleEngine().execute(
+                self.ruleset, RuleContext({'amount': amount}))
+            context = engine.execute(
+                self.ruleset, RuleContext({'amount': amount}))
+            self.assertEqual(context.to_dict(), expected.to_dict())
+            self.assertEqual(context._executed, expected._executed)
+
+    def test_stats(self):
+        profiler = Profiler()
+        engine = RuleEngine(profiler=profiler)
+        for amount in (5, 20, 8):
+            engine.execute(self.ruleset, RuleContext({'amount': amount}))
+        stats = profiler.stats
+        self.assertEqual(sorted(stats), [
+            ('SequencedRuleset',),
+            ('SequencedRuleset', 'ConditionalRule'),
+            ('SequencedRuleset', 'Table'),
+            ('SequencedRuleset', 'Table', 'big'),
+            ('SequencedRuleset', 'Table', 'row 2'),
+        ])
+        big = stats[('SequencedRuleset', 'Table', 'big')]
+        self.assertEqual((big.calls, big.triggered), (3, 1))
+        self.assertEqual(big.conditions, {'cond1': [1, 3], 'cond2': [2, 3]})
+        small = stats[('SequencedRuleset', 'Table', 'row 2')]
+        self.assertEqual(small.triggered, 2)
+        self.assertEqual(
+            small.conditions, {'cond1': [2, 3], 'cond2': [0, 3]})
+        self.assertGreater(big.condition_time, 0)
+        table = stats[('SequencedRuleset', 'Table')]
+        self.assertGreaterEqual(table.time, big.time + small.time)
+        self.assertIn('SequencedRuleset > Table > big', profiler.report())
+        lines = profiler.collapsed().splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertTrue(lines[3].startswith('SequencedRuleset;Table;big '))
+        profiler.reset()
+        self.assertEqual(profiler.stats, {})
+
+    def test_hit_policy(self):
+        table = TableRule(self.table.rules, name='Table', hit_policy='first')
+        profiler = Profiler()
+        engine = RuleEngine(profiler=profiler)
+        for amount in (5, 20):
+            expected = RuleEngine().execute(
+                [table], RuleContext({'amount': amount, 'vip': True}))
+            context = engine.execute(
+                [table], RuleContext({'amount': amount, 'vip': True}))
+            self.assertEqual(context.to_dict(), expected.to_dict())
+        # Rows after the first match aren't evaluated
+        self.assertEqual(profiler.stats[('Table', 'big')].calls, 2)
+        self.assertEqual(profiler.stats[('Table', 'row 2')].calls, 1)
+
+    def test_conditions_before_actions(self):
+        table = TableRule([
+            {'if': [{'amount__gt': 10}], 'then': ['0'], 'target': ['amount']},
+            {'if': {'logic': '1 & 2', 'conditions': [
+                {'amount__gt': 0}, {'amount__missing': 1}]},
+             'then': ['1'], 'target': ['never']},
+        ], name='Table')
+        profiler = Profiler()
+        context = RuleEngine(profiler=profiler).execute(
+            [table], RuleContext({'amount': 20}))
+        self.assertEqual(context.to_dict(), {'amount': 0})
+        first = profiler.stats[('Table', 'row 1')]
+        self.assertEqual(first.triggered, 1)
+        self.assertEqual(first.conditions, {'cond1': [1, 1]})
+        # Conditions and/or skip may raise
+        second = profiler.stats[('Table', 'row 2')]
+        self.assertEqual(second.triggered, 0)
+        self.assertEqual(second.conditions, {'cond1': [0, 1]})
@@ -1,6 +1,11 @@
+import json
+import pickle
+import sys
+import threading
 import unittest
 from pyrules import DictObject, RuleContext, RuleEngine, Translator
 from pyrules import Rule, ConditionalRule, TableRule
+from pyrules.rules import HitPolicyError
 
 
 class DictObjectTest(unittest.TestCase):
@@ -32,6 +37,43 @@ class EngineTest(unittest.TestCase):
         context.foo1 = '123'
         self.assertEqual(context.to_dict(), {'foo': 'bar', 'foo1': '123'})
         self.assertEqual(context.foo1, '123')
+        self.assertEqual(context['missing'], None)
+        with self.assertRaises(KeyError):
+            context['_executed']
+        self.assertEqual(RuleContext({'_ignored': 1}).to_dict(), {})
+        # Names starting with '_' are attributes, like for DictObject
+        self.assertIsInstance(context, DictObject)
+        context.update({'_extra': 1})
+        context._other = 2
+        self.assertEqual((context._extra, context._other), (1, 2))
+        self.assertEqual(context._missing, None)
+        self.assertEqual(RuleContext({'_extra': 1})._extra, 1)
+        self.assertEqual(context.to_dict(), {'foo': 'bar', 'foo1': '123'})
+        with self.assertRaises(KeyError):
+            context['_extra']
+        context = pickle.loads(pickle.dumps(context, 2))
+        self.assertEqual((context._extra, context._other), (1, 2))
+
+    def test_rule_context_fork(self):
+        context = RuleContext({'foo': 'bar', 'x': 1})
+        context._executed.append(('Rule', 1))
+        fork = context.fork()
+        self.assertIs(fork.to_dict(copy=False), context.to_dict(copy=False))
+        self.assertEqual(fork._executed, [])
+        fork.foo = 'baz'
+        context['y'] = 2
+        self.assertEqual(fork.to_dict(), {'foo': 'baz', 'x': 1})
+        self.assertEqual(context.to_dict(), {'foo': 'bar', 'x': 1, 'y': 2})
+        data = context.to_dict()
+        data['z'] = 3
+        self.assertEqual(context.z, None)
+
+    def test_rule_context_pickle(self):
+        context = RuleContext({'foo': 'bar'})
+        context._executed.append(('Rule', 1))
+        context = pickle.loads(pickle.dumps(context, 2))
+        self.assertEqual(context.to_dict(), {'foo': 'bar'})
+        self.assertEqual(context._executed, [('Rule', 1)])
 
 
 class LanguageTest(unittest.TestCase):
@@ -88,6 +130,40 @@ class RuleTest(unittest.TestCase):
             [('TableRule.1', 20), ('TableRule.1', 30), ('TableRule', True)])
         self.assertEqual(context.to_dict(), {'foo': True, 'bar1': 20, 'bar2': 30})
 
+    def test_table_rule_actions(self):
+        trule = TableRule([
+            {'if': [True], 'then': ['context.foo * 2', 5],
+             'target': ['context.bar', 'baz']}])
+        for foo in (1, 2):
+            context = RuleContext({'foo': foo})
+            RuleEngine().execute([trule], context)
+            self.assertEqual(
+                context.to_dict(), {'foo': foo, 'bar': foo * 2, 'baz': 5})
+
+    def test_memoize(self):
+        rules = [
+            {'if': [{'vip': True}, {'amount__gt': 10}], 'then': [1],
+             'target': ['a']},
+            {'if': {'logic': '1 & ~2', 'conditions': [
+                {'vip': True}, {'amount__gt': 10}]},
+             'then': ['context.amount + 10'], 'target': ['amount']},
+            {'if': [{'vip': True}, {'amount__gt': 10}], 'then': [3],
+             'target': ['c']},
+        ]
+        trule = TableRule(rules)
+        context = RuleContext({'vip': True, 'amount': 5})
+        RuleEngine(memoize=True).execute([trule], context)
+        self.assertEqual(
+            context.to_dict(), {'vip': True, 'amount': 15, 'c': 3})
+        # The second row writes 'amount', so the third row evaluates
+        # 'amount__gt' again.
+        self.assertEqual(context._memo.misses, 3)
+        self.assertEqual(context._memo.hits, 3)
+        expected = RuleContext({'vip': True, 'amount': 5})
+        RuleEngine().execute([trule], expected)
+        self.assertEqual(context._executed, expected._executed)
+        self.assertEqual(expected._memo, None)
+
     def _test_engine(self):
         # XXX translations currently don't work. But we'll adapt this test
         # for NaturalLanguageRule later, so not deleting just yet.
@@ -262,4 +338,115 @@ rules:
              ('TestTableRule', True)])
         self.assertEqual(
             context.to_dict(), {'foo': 15, 'bar1': 20, 'bar2': 30})
-        
\ No newline at end of file
+        
+    def test_hit_policies(self):
+        rows = [
+            {'rule': 'low', 'if': [{'amount__gt': 10}], 'then': [1],
+             'target': ['rate']},
+            {'rule': 'high', 'priority': 5, 'if': [{'amount__gt': 100}],
+             'then': [2], 'target': ['rate']},
+            {'rule': 'none', 'if': [{'amount__lte': 10}], 'then': [0],
+             'target': ['rate']},
+        ]
+        expected = {
+            'collect': [('T.low', 1), ('T.high', 2), ('T', True)],
+            'first': [('T.low', 1), ('T', True)],
+            'priority': [('T.high', 2), ('T', True)],
+            'any': [('T.low', 1), ('T', True)],
+        }
+        for indexed in (False, True):
+            for policy, executed in expected.items():
+                trule = TableRule(
+                    rows, name='T', indexed=indexed, hit_policy=policy)
+                context = RuleEngine().execute(
+                    [trule], RuleContext({'amount': 200}))
+                self.assertEqual(context._executed, executed)
+            trule = TableRule(
+                rows, name='T', indexed=indexed, hit_policy='unique')
+            context = RuleEngine().execute(
+                [trule], RuleContext({'amount': 5}))
+            self.assertEqual(context.rate, 0)
+            with self.assertRaises(HitPolicyError):
+                RuleEngine().execute([trule], RuleContext({'amount': 200}))
+        with self.assertRaises(ValueError):
+            TableRule(rows, hit_policy='last')
+
+    def test_hit_policy_first_stops(self):
+        trule = TableRule.from_json(json.dumps({
+            'hit_policy': 'first',
+            'rules': [
+                {'if': [True], 'then': ['context.n + 1'], 'target': ['n']},
+                {'if': [{'n__contains': 1}], 'then': [0], 'target': ['n']}]}))
+        self.assertEqual(trule.hit_policy, 'first')
+        # The second row would fail, it's never evaluated
+        context = RuleEngine().execute([trule], RuleContext({'n': 1}))
+        self.assertEqual(context.n, 2)
+
+    def test_hit_policy_any_order(self):
+        trule = TableRule([
+            {'if': [{'kind': 'a'}], 'then': ['"a"'], 'target': ['found']},
+            {'if': [{'kind': 'b'}], 'then': ['"b"'], 'target': ['found']},
+            {'if': [{'kind': 'c'}], 'then': ['"c"'], 'target': ['found']},
+        ], hit_policy='any')
+        for kind in 'cccb':
+            context = RuleEngine().execute(
+                [trule], RuleContext({'kind': kind}))
+            self.assertEqual(context.found, kind)
+        # Rows move ahead as they fire more often
+        self.assertEqual(trule._ranking[0], [2, 1, 0])
+        trule = pickle.loads(pickle.dumps(trule))
+        self.assertEqual(trule._ranking[0], [2, 1, 0])
+        self.assertEqual(trule.hit_policy, 'any')
+
+    def test_adaptive(self):
+        trule = TableRule.from_json(json.dumps({
+            'adaptive': True,
+            'rules': [
+                {'if': [{'a': 1}, {'b': 1}], 'then': [1], 'target': ['x']},
+                {'if': [True], 'then': [2], 'target': ['y']}]}))
+        self.assertTrue(trule.adaptive)
+        evaluator = trule._evaluators[0]
+        evaluator.SAMPLE_SIZE = 5
+        for i in xrange(5):
+            RuleEngine().execute([trule], RuleContext({'a': 1, 'b': 0}))
+        stats = json.loads(json.dumps(trule.get_condition_stats()))
+        self.assertEqual(stats[1], None)
+        self.assertEqual(stats[0]['conditions']['cond2'][:2], [0, 5])
+        self.assertEqual(evaluator.logic, evaluator.parse_logic('2 & 1'))
+        restored = TableRule(trule.rules, adaptive=True)
+        restored.set_condition_stats(stats)
+        self.assertEqual(restored._evaluators[0].logic, evaluator.logic)
+        self.assertFalse(TableRule(trule.rules).adaptive)
+
+    def test_table_rule_threads(self):
+        # Rules are shared by threads, i.e. by RuleStore
+        trule = TableRule([
+            {'rule': 'row{}'.format(i), 'if': [{'value': i}],
+             'then': [i], 'target': ['result']}
+            for i in xrange(8)], name='T', hit_policy='any')
+        errors = []
+
+        def run(value):
+            for i in xrange(500):
+                context = RuleEngine().execute(
+                    [trule], RuleContext({'value': value}))
+                if context._executed != [
+                        ('T.row{}'.format(value), value), ('T', True)]:
+                    errors.append(context._executed)
+
+        threads = [
+            threading.Thread(target=run, args=(value,))
+            for value in xrange(8)]
+        # Switch threads often, so races show up
+        interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setcheckinterval(interval)
+        self.assertEqual(errors, [])
+        self.assertEqual(trule._hits, [500] * 8)
+        self.assertEqual(sorted(trule._ranking[0]), range(8))
@@ -0,0 +1,79 @@
+import random
+import unittest
+from pyrules import (
+    ConditionalRule, RuleContext, RuleEngine, SequencedRuleset, TableRule)
+
+
+def make_ruleset(rnd):
+    rows = []
+    for i in xrange(40):
+        key = rnd.choice(['amount', 'discount', 'country', 'total'])
+        if key == 'country':
+            condition = {'country': rnd.choice(['CH', 'DE'])}
+        else:
+            condition = {key + '__gt': rnd.randint(0, 50)}
+        rows.append({
+            'if': [condition],
+            'then': [rnd.choice([
+                'context.amount + {}'.format(i), '{}'.format(i),
+                '(context.total or 0) + 1'])],
+            'target': [rnd.choice(['total', 'discount', 'fee'])]})
+    vip = ConditionalRule(
+        condition=lambda rule, context: context.vip,
+        action=lambda rule, context: {'discount': 20})
+    return [
+        TableRule(rows[:20], name='First'),
+        SequencedRuleset([vip, TableRule(rows[20:], name='Second')]),
+    ]
+
+
+class RuleSessionTest(unittest.TestCase):
+    def test_same_results(self):
+        rnd = random.Random(3)
+        engine = RuleEngine()
+        ruleset = make_ruleset(rnd)
+        inputs = {'amount': 10, 'country': 'CH', 'vip': False}
+        session = engine.session(ruleset, inputs)
+        for i in xrange(100):
+            expected = engine.execute(ruleset, RuleContext(inputs))
+            self.assertEqual(session.context.to_dict(), expected.to_dict())
+            self.assertEqual(session.context._executed, expected._executed)
+            delta = dict([rnd.choice([
+                ('amount', rnd.randint(0, 60)),
+                ('country', rnd.choice(['CH', 'DE'])),
+                ('vip', rnd.choice([True, False]))])])
+            inputs.update(delta)
+            session.update(delta)
+
+    def test_evaluated(self):
+        ruleset = [TableRule([
+            {'if': [{'amount__gt': 10}], 'then': ['1'], 'target': ['a']},
+            {'if': [{'country': 'CH'}], 'then': ['2'], 'target': ['b']},
+            {'if': [{'a': 1}], 'then': ['context.amount'], 'target': ['c']},
+        ])]
+        session = RuleEngine().session(
+            ruleset, {'amount': 20, 'country': 'DE'})
+        self.assertEqual(session.evaluated, 3)
+        context = session.update({'country': 'CH'})
+        self.assertEqual(session.evaluated, 1)
+        self.assertEqual(context.to_dict(), {
+            'amount': 20, 'country': 'CH', 'a': 1, 'b': 2, 'c': 20})
+        context = session.update({'amount': 30})
+        self.assertEqual(session.evaluated, 1)
+        self.assertEqual(context.c, 30)
+        session.update({'amount': 30})
+        self.assertEqual(session.evaluated, 0)
+
+    def test_context_methods(self):
+        ruleset = [TableRule([
+            {'if': [{'amount__gt': 0}], 'then': ['len(context.to_dict())'],
+             'target': ['n']},
+        ])]
+        engine = RuleEngine()
+        session = engine.session(ruleset, {'amount': 20})
+        self.assertEqual(session.context.n, 1)
+        context = session.update({'extra': 1})
+        expected = engine.execute(
+            ruleset, RuleContext({'amount': 20, 'extra': 1}))
+        self.assertEqual(context.to_dict(), expected.to_dict())
+        self.assertEqual(context.n, 2)
@@ -0,0 +1,83 @@
+from django.test import TestCase
+from .. import models, storage
+from .. import RuleContext, RuleEngine, RuleStore
+from ..storages.cache import CachedStorage, get_definition_cache
+
+
+class CachedStorageTest(TestCase):
+    def setUp(self):
+        get_definition_cache().clear()
+        self.ruleset = models.Ruleset.objects.create(name='Cached set')
+        self.trules = []
+        for i in xrange(3):
+            trule = models.TableRule.objects.create(
+                name='Cached{}'.format(i), slug='cached{}'.format(i),
+                tablerule_format=models.TableRule.TF_JSON,
+                definition='{{"rules": [{{"if": [true], "then": [{}], '
+                           '"target": ["foo{}"]}}]}}'.format(i, i))
+            models.RulePosition.objects.create(
+                rule=trule, ruleset=self.ruleset, priority=i)
+            self.trules.append(trule)
+        self.storage = CachedStorage()
+
+    def tearDown(self):
+        get_definition_cache().clear()
+
+    def execute(self, rules):
+        context = RuleEngine().execute(rules, RuleContext())
+        return context.to_dict()
+
+    def test_ruleset(self):
+        expected = {'foo0': 0, 'foo1': 1, 'foo2': 2}
+        self.assertEqual(
+            self.execute(self.storage.get_ruleset('Cached set')), expected)
+        self.storage.get_rule('cached1')
+        with self.assertNumQueries(0):
+            rules = self.storage.get_ruleset('Cached set')
+            version = self.storage.get_ruleset_version('Cached set')
+            rule_obj = self.storage.get_rule('cached1')
+            self.storage.get_rule_version('cached1')
+        self.assertEqual(self.execute(rules), expected)
+        self.assertEqual(self.execute([rule_obj]), {'foo1': 1})
+        # Rules are built once per version and shared
+        self.assertIs(self.storage.get_rule('cached1'), rule_obj)
+        self.assertIs(self.storage.get_ruleset('Cached set')[0], rules[0])
+        # Saved rules are loaded again
+        trule = self.trules[1]
+        trule.definition = trule.definition.replace('[1]', '[10]')
+        trule.save()
+        self.assertEqual(
+            self.execute(self.storage.get_ruleset('Cached set'))['foo1'], 10)
+        self.assertNotEqual(
+            self.storage.get_ruleset_version('Cached set'), version)
+        self.assertEqual(
+            self.execute([self.storage.get_rule('cached1')]), {'foo1': 10})
+        # So are changed positions
+        models.RulePosition.objects.get(rule=self.trules[0]).delete()
+        self.assertEqual(
+            self.execute(self.storage.get_ruleset('Cached set')),
+            {'foo1': 10, 'foo2': 2})
+
+    def test_renamed(self):
+        self.storage.get_rule('cached0')
+        self.storage.get_ruleset('Cached set')
+        self.trules[0].slug = 'renamed'
+        self.trules[0].save()
+        with self.assertRaises(models.Rule.DoesNotExist):
+            self.storage.get_rule('cached0')
+        self.ruleset.name = 'Renamed set'
+        self.ruleset.save()
+        with self.assertRaises(models.Ruleset.DoesNotExist):
+            self.storage.get_ruleset('Cached set')
+        self.assertEqual(
+            len(self.storage.get_rulesets(['Renamed set'])['Renamed set']),
+            3)
+
+    def test_rule_store(self):
+        store = RuleStore(
+            backend='pyrules.storages.cache.CachedStorage',
+            cache=storage.RuleCache())
+        rules = store.get_ruleset('Cached set')
+        # Versions are checked in the Django cache
+        with self.assertNumQueries(0):
+            self.assertIs(store.get_ruleset('Cached set'), rules)
@@ -0,0 +1,53 @@
+import pickle
+import unittest
+from pyrules import ExecutionTrace, RuleContext, RuleEngine, TableRule
+
+
+class ExecutionTraceTest(unittest.TestCase):
+    def setUp(self):
+        self.ruleset = [TableRule([
+            {'if': [{'value__gt': 1}], 'then': [1], 'target': ['a']},
+            {'if': [{'value__gt': 2}], 'then': [2, 3], 'target': ['b', 'c']},
+        ], name='Table')]
+
+    def execute(self, **kwargs):
+        engine = RuleEngine(**kwargs)
+        return engine.execute(self.ruleset, RuleContext({'value': 5}))
+
+    def test_full(self):
+        context = self.execute()
+        expected = [
+            ('Table.1', 1), ('Table.2', 2), ('Table.2', 3), ('Table', True)]
+        self.assertEqual(context._executed, expected)
+        self.assertEqual(len(context._executed), 4)
+        self.assertIn(('Table', True), context._executed)
+
+    def test_levels(self):
+        context = self.execute(trace=ExecutionTrace.OFF)
+        self.assertEqual(context._executed, [])
+        self.assertEqual(context._executed.total, 0)
+        context = self.execute(trace=ExecutionTrace.COUNTS)
+        self.assertEqual(context._executed, [])
+        self.assertEqual(
+            context._executed.counts,
+            {'Table.1': 1, 'Table.2': 2, 'Table': 1})
+        context = self.execute(trace=ExecutionTrace.IDS)
+        self.assertEqual(
+            context._executed, ['Table.1', 'Table.2', 'Table.2', 'Table'])
+
+    def test_ring_buffer(self):
+        context = self.execute(trace_size=3)
+        self.assertEqual(
+            context._executed,
+            [('Table.2', 2), ('Table.2', 3), ('Table', True)])
+        self.assertEqual(context._executed.total, 4)
+        context = self.execute(trace=ExecutionTrace.IDS, trace_size=2)
+        self.assertEqual(context._executed, ['Table.2', 'Table'])
+
+    def test_fork_and_pickle(self):
+        context = self.execute(trace=ExecutionTrace.IDS, trace_size=2)
+        fork = context.fork()
+        self.assertEqual(fork._executed.level, ExecutionTrace.IDS)
+        self.assertEqual(fork._executed, [])
+        context = pickle.loads(pickle.dumps(context))
+        self.assertEqual(context._executed, ['Table.2', 'Table'])
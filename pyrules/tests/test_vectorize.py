@@ -0,0 +1,56 @@
+import random
+import unittest
+from pyrules import RuleContext, RuleEngine, TableRule, ConditionalRule
+from .. import vectorize
+
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(7)
+        self.records = [
+            {'amount': rnd.randint(0, 100),
+             'price': rnd.random() * 10,
+             'vip': rnd.random() > 0.5,
+             'country': rnd.choice(['CH', 'DE', 'FR']),
+             'user': {'age': rnd.randint(10, 80)}}
+            for i in xrange(200)]
+        # Mixed types and missing keys can't be vectorized
+        self.records[3]['price'] = 'n/a'
+        del self.records[5]['vip']
+        self.ruleset = [
+            TableRule([
+                {'if': {'logic': '1 & (2 | ~3)', 'conditions': [
+                    {'amount__gt': 20}, 'vip', {'country': 'CH'}]},
+                 'then': ['context.amount * 2'], 'target': ['total']},
+                {'if': [{'price__lte': 5.0, 'country__contains': 'E'}],
+                 'then': ['1', '"cheap"'], 'target': ['a', 'label']},
+                {'if': [{'user__age__gte': 18}],
+                 'then': ['True'], 'target': ['adult']},
+                {'if': [{'total__gt': 100}],
+                 'then': ['context.total - 10'], 'target': ['total']},
+                {'if': [True], 'then': [0], 'target': ['done']},
+            ], name='Table'),
+            ConditionalRule(
+                condition=lambda self, context: context.adult,
+                action=lambda self, context: {'b': context.amount}),
+        ]
+
+    def _assert_same(self, engine):
+        contexts = engine.execute_batch(self.ruleset, self.records)
+        self.assertEqual(len(contexts), len(self.records))
+        for record, context in zip(self.records, contexts):
+            expected = engine.execute(self.ruleset, RuleContext(record))
+            self.assertEqual(context.to_dict(), expected.to_dict())
+            self.assertEqual(context._executed, expected._executed)
+
+    @unittest.skipIf(vectorize.numpy is None, 'NumPy is not installed')
+    def test_vectorized(self):
+        self._assert_same(RuleEngine())
+        self._assert_same(RuleEngine(memoize=True))
+
+    def test_without_numpy(self):
+        numpy, vectorize.numpy = vectorize.numpy, None
+        try:
+            self._assert_same(RuleEngine())
+        finally:
+            vectorize.numpy = numpy
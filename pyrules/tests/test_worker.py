@@ -0,0 +1,73 @@
+import multiprocessing
+from django.test import TestCase
+from django.test.utils import override_settings
+from .. import models, storage, worker
+
+
+class WorkerTest(TestCase):
+    def setUp(self):
+        self.trule = models.TableRule.objects.create(
+            name='Preloaded', slug='preloaded',
+            tablerule_format=models.TableRule.TF_JSON,
+            definition='{"rules": [{"if": [true], "then": [1], '
+                       '"target": ["foo"]}]}')
+        ruleset = models.Ruleset.objects.create(name='PreloadedSet')
+        models.RulePosition.objects.create(
+            rule=self.trule, ruleset=ruleset, priority=1)
+        self.cache = storage.get_cache()
+        self.cache.invalidate()
+
+    def tearDown(self):
+        worker._generation = None
+        worker._seen = 0
+        worker._store = None
+        self.cache.invalidate()
+
+    @override_settings(
+        PYRULES_PRELOAD_RULES=['preloaded'],
+        PYRULES_PRELOAD_RULESETS=['PreloadedSet'],
+        PYRULES_CACHE_CHECK_VERSIONS=False)
+    def test_preload_and_invalidate(self):
+        worker._store = None
+        worker._preload()
+        self.assertEqual(self.cache.stats()['size'], 2)
+        store = worker.get_store()
+        # Preloaded rules are used without queries
+        with self.assertNumQueries(0):
+            rule_obj = store.get_rule('preloaded')
+            store.get_ruleset('PreloadedSet')
+        worker._generation = multiprocessing.Value('i', 0)
+        worker.check_cache()
+        self.assertIs(store.get_rule('preloaded'), rule_obj)
+        # Changes are picked up after a broadcast
+        self.trule.definition = self.trule.definition.replace('1', '2')
+        self.trule.save()
+        self.assertEqual(
+            worker.pyrules_invalidate(None), {'ok': 'rule cache invalidated'})
+        self.assertEqual(worker._generation.value, 1)
+        worker.check_cache()
+        self.assertEqual(self.cache.stats()['size'], 2)
+        self.assertEqual(
+            store.get_rule('preloaded').rules[0]['then'], [2])
+
+    def test_rules_changed(self):
+        storage.RuleStore().get_rule('preloaded')
+        self.assertEqual(self.cache.stats()['size'], 1)
+        # Saving rules invalidates the local cache, broadcast is disabled
+        models.Ruleset.objects.create(name='Other')
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    @override_settings(PYRULES_PRELOAD_RULESETS=['PreloadedSet'])
+    def test_save_condition_stats(self):
+        self.trule.definition = (
+            '{"adaptive": true, "rules": [{"if": ["foo", "bar"], '
+            '"then": [1], "target": ["foo"]}]}')
+        self.trule.save()
+        worker._store = None
+        worker._preload()
+        rule_obj, = worker.get_store().get_ruleset('PreloadedSet')
+        rule_obj._evaluators[0].evaluate({'foo': True, 'bar': False})
+        worker._save_condition_stats()
+        trule = models.TableRule.objects.get(pk=self.trule.pk)
+        stats = trule.load_rule().get_condition_stats()
+        self.assertEqual(stats[0]['conditions']['cond2'][:2], [0, 1])
@@ -0,0 +1,96 @@
+from array import array
+
+
+class ExecutionTrace(object):
+    """
+    Trace of the rules executed in a context, available as
+    context._executed. What is recorded depends on the level:
+
+    OFF    - nothing
+    COUNTS - number of executions per rule id, see counts
+    IDS    - rule ids in order of execution, interned
+    FULL   - (rule id, result) in order of execution
+
+    With a size, only the last size entries are kept in a preallocated ring
+    buffer. The trace compares equal to the list of its entries.
+    """
+    OFF, COUNTS, IDS, FULL = range(4)
+
+    def __init__(self, level=FULL, size=None):
+        self.level = level
+        self.size = size
+        # Number of entries recorded, including those dropped
+        self.total = 0
+        self.counts = {}
+        self._names = []
+        self._ids = {}
+        if level == self.IDS:
+            self._buffer = array('l', [0] * (size or 0))
+        else:
+            self._buffer = [None] * (size or 0)
+
+    def record(self, ruleid, result):
+        level = self.level
+        if not level:
+            return
+        elif level == self.COUNTS:
+            self.counts[ruleid] = self.counts.get(ruleid, 0) + 1
+            self.total += 1
+            return
+        elif level == self.IDS:
+            try:
+                entry = self._ids[ruleid]
+            except KeyError:
+                entry = self._ids[ruleid] = len(self._names)
+                self._names.append(ruleid)
+        else:
+            entry = (ruleid, result)
+        if self.size:
+            self._buffer[self.total % self.size] = entry
+        else:
+            self._buffer.append(entry)
+        self.total += 1
+
+    def append(self, item):
+        """
+        Record a (rule id, result) tuple, like list.append.
+        """
+        self.record(*item)
+
+    def entries(self):
+        """
+        Return recorded entries, oldest first. These are rule ids for level
+        IDS and (rule id, result) tuples for level FULL.
+        """
+        if self.level < self.IDS:
+            return []
+        if not self.size or self.total <= self.size:
+            entries = list(self._buffer[:self.total])
+        else:
+            start = self.total % self.size
+            entries = list(self._buffer[start:]) + list(self._buffer[:start])
+        if self.level == self.IDS:
+            return [self._names[entry] for entry in entries]
+        return entries
+
+    def __iter__(self):
+        return iter(self.entries())
+
+    def __len__(self):
+        if self.level < self.IDS:
+            return 0
+        return min(self.total, self.size) if self.size else self.total
+
+    def __contains__(self, item):
+        return item in self.entries()
+
+    def __eq__(self, other):
+        if isinstance(other, ExecutionTrace):
+            other = other.entries()
+        return self.entries() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(self.entries())
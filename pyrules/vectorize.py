@@ -0,0 +1,159 @@
+"""
+Vectorized execution of rulesets over many contexts. Requires NumPy, without
+it every context is executed by the scalar engine.
+"""
+from .conditions import C
+from .rules import TableRule
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class Unvectorizable(Exception):
+    pass
+
+
+class BatchExecutor(object):
+    """
+    Executes a ruleset for a batch of contexts, rule by rule. TableRule
+    conditions on top-level context keys are evaluated as NumPy masks over
+    columns built from the contexts, actions are run for matching contexts
+    only. Rows with conditions that can't be vectorized (nested paths,
+    missing keys, mixed types) are evaluated per context, other rules and
+    TableRules with a hit policy are executed by the scalar engine. Results
+    are the same as executing each context on its own, since contexts don't
+    share state.
+    """
+    # Operators that can be applied to columns
+    OPS = ('gt', 'lt', 'gte', 'lte', 'eq', 'neq', 'bool', 'contains')
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def execute(self, ruleset, contexts):
+        if not contexts:
+            return contexts
+        for rule in ruleset:
+            if (numpy is not None and type(rule) is TableRule and
+                    rule.hit_policy == 'collect' and
+                    self.engine.profiler is None):
+                self.execute_table(rule, contexts)
+            else:
+                for context in contexts:
+                    self.engine.execute([rule], context)
+        return contexts
+
+    def execute_table(self, trule, contexts):
+        counts = numpy.zeros(len(contexts), int)
+        columns = {}
+        for index, evaluator in enumerate(trule._evaluators):
+            try:
+                mask = self.mask(evaluator, contexts, columns)
+            except Unvectorizable:
+                mask = numpy.array([
+                    evaluator.evaluate(context, context._memo)
+                    for context in contexts], bool)
+            fired = numpy.flatnonzero(mask)
+            if not len(fired):
+                continue
+            counts[fired] += 1
+            for i in fired:
+                trule._fire(index, contexts[i], int(counts[i]))
+            # Actions changed these keys, columns are rebuilt on next use
+            for target, _action in trule._actions[index]:
+                columns.pop(target, None)
+        for context in contexts:
+            trule.record(context, True)
+
+    def mask(self, evaluator, contexts, columns):
+        """
+        Return a boolean array telling which contexts match the evaluator.
+        Raises Unvectorizable if that can't be computed on columns.
+        """
+        if evaluator._force_conditions is not None:
+            return numpy.repeat(
+                bool(evaluator._force_conditions), len(contexts))
+        return evaluator.fold(
+            lambda expression, value: self._mask_leaf(
+                expression, value, contexts, columns),
+            self._combine, lambda mask: ~mask)
+
+    def _combine(self, op, left, right):
+        if op == C.AND:
+            return left & right
+        elif op == C.OR:
+            return left | right
+        return left ^ right
+
+    def _mask_leaf(self, expression, arg, contexts, columns):
+        bits = expression.split('__')
+        if len(bits) == 1:
+            op = 'eq'
+        elif len(bits) == 2 and bits[1] in self.OPS:
+            op = bits[1]
+        else:
+            raise Unvectorizable(expression)
+        column = self._column(bits[0], contexts, columns)
+        if column.dtype.kind in 'SU':
+            if type(arg) is not type(column[0].item()):
+                raise Unvectorizable(expression)
+            if op == 'contains':
+                mask = numpy.char.find(column, arg) >= 0
+            elif op == 'bool':
+                raise Unvectorizable(expression)
+            else:
+                mask = self._compare(op, column, arg)
+        else:
+            if type(arg) not in (bool, int, long, float):
+                raise Unvectorizable(expression)
+            if op == 'contains':
+                raise Unvectorizable(expression)
+            elif op == 'bool':
+                mask = (column != 0) == arg
+            else:
+                mask = self._compare(op, column, arg)
+        if not isinstance(mask, numpy.ndarray) or mask.shape != column.shape:
+            raise Unvectorizable(expression)
+        return mask
+
+    @staticmethod
+    def _compare(op, column, arg):
+        if op == 'gt':
+            return column > arg
+        elif op == 'lt':
+            return column < arg
+        elif op == 'gte':
+            return column >= arg
+        elif op == 'lte':
+            return column <= arg
+        elif op == 'eq':
+            return column == arg
+        return column != arg
+
+    @staticmethod
+    def _column(key, contexts, columns):
+        """
+        Return an array of the values of key in contexts. Only columns of
+        numbers, booleans or strings of one type are vectorized.
+        """
+        try:
+            column = columns[key]
+        except KeyError:
+            values = [context[key] for context in contexts]
+            kinds = set(type(value) for value in values)
+            if kinds == set([bool]):
+                column = numpy.array(values, bool)
+            elif kinds and kinds <= set([int, long, float]):
+                column = numpy.array(values)
+                if column.dtype.kind not in 'if':
+                    column = None
+            elif kinds == set([str]) or kinds == set([unicode]):
+                column = numpy.array(values)
+            else:
+                column = None
+            columns[key] = column
+        if column is None:
+            raise Unvectorizable(key)
+        return column
@@ -0,0 +1,144 @@
+"""
+Celery worker support: the engine and store reused by tasks, rules preloaded
+in every worker process and cache invalidation broadcast when rules change.
+
+Workers preload the rules and rulesets named in the PYRULES_PRELOAD_RULES
+and PYRULES_PRELOAD_RULESETS settings. With PYRULES_INVALIDATION_BROADCAST
+enabled, saving or deleting rules in Django sends the pyrules_invalidate
+control command to all workers. Workers can then set
+PYRULES_CACHE_CHECK_VERSIONS to False, so tasks don't query the database
+for rules at all.
+
+When a pool process shuts down, the condition statistics of preloaded
+adaptive TableRules are saved, so restarted workers evaluate conditions in
+the order learned so far.
+"""
+import logging
+import multiprocessing
+from celery import current_app
+from celery.signals import (
+    worker_init, worker_process_init, worker_process_shutdown)
+from celery.worker.control import Panel
+from django.conf import settings
+from . import models, rules
+from .engine import RuleEngine
+from .storage import RuleStore, get_cache
+
+
+logger = logging.getLogger(__name__)
+
+_engine = None
+_store = None
+# Invalidation counter shared by the worker and its pool processes, created
+# before the pool starts. Control commands are handled by the worker, pool
+# processes compare the counter with the last one they've seen.
+_generation = None
+_seen = 0
+
+
+def get_engine():
+    """
+    Return the RuleEngine of this process.
+    """
+    global _engine
+    if _engine is None:
+        _engine = RuleEngine()
+    return _engine
+
+
+def get_store():
+    """
+    Return the RuleStore of this process.
+    """
+    global _store
+    if _store is None:
+        _store = RuleStore()
+    return _store
+
+
+def preload():
+    """
+    Load the configured rules and rulesets into the cache.
+    """
+    store = get_store()
+    for name in getattr(settings, 'PYRULES_PRELOAD_RULES', ()):
+        store.get_rule(name)
+    for name in getattr(settings, 'PYRULES_PRELOAD_RULESETS', ()):
+        store.get_ruleset(name)
+
+
+def save_condition_stats():
+    """
+    Save the condition statistics of the preloaded adaptive TableRules.
+    """
+    store = get_store()
+    loaded = [
+        (name, store.get_rule(name))
+        for name in getattr(settings, 'PYRULES_PRELOAD_RULES', ())]
+    for name in getattr(settings, 'PYRULES_PRELOAD_RULESETS', ()):
+        # Same order as the rules loaded by DjangoStorage
+        slugs = models.RulePosition.objects.filter(
+            ruleset__name=name).values_list('rule__slug', flat=True)
+        loaded.extend(zip(slugs, store.get_ruleset(name)))
+    for slug, rule_obj in loaded:
+        if isinstance(rule_obj, rules.TableRule) and rule_obj.adaptive:
+            models.TableRule.objects.get(slug=slug).save_condition_stats(
+                rule_obj)
+
+
+def check_cache():
+    """
+    Drop cached rules if an invalidation was broadcast since the last check,
+    and preload again. Called by tasks before rules are loaded.
+    """
+    global _seen
+    if _generation is not None and _generation.value != _seen:
+        _seen = _generation.value
+        get_cache().invalidate()
+        preload()
+
+
+def rules_changed():
+    """
+    Invalidate cached rules after rules were saved or deleted, in this
+    process and, if enabled, in all workers. Errors sending the broadcast
+    are logged.
+    """
+    get_cache().invalidate()
+    if not getattr(settings, 'PYRULES_INVALIDATION_BROADCAST', False):
+        return
+    try:
+        current_app.control.broadcast('pyrules_invalidate')
+    except Exception:
+        logger.exception('Broadcasting rule cache invalidation failed')
+
+
+@worker_init.connect
+def _create_generation(**kwargs):
+    global _generation
+    _generation = multiprocessing.Value('i', 0)
+
+
+@worker_process_init.connect
+def _preload(**kwargs):
+    try:
+        preload()
+    except Exception:
+        logger.exception('Preloading rules failed')
+
+
+@worker_process_shutdown.connect
+def _save_condition_stats(**kwargs):
+    try:
+        save_condition_stats()
+    except Exception:
+        logger.exception('Saving condition statistics failed')
+
+
+@Panel.register
+def pyrules_invalidate(state, **kwargs):
+    if _generation is not None:
+        with _generation.get_lock():
+            _generation.value += 1
+    get_cache().invalidate()
+    return {'ok': 'rule cache invalidated'}
@@ -39,6 +39,10 @@ setup(
         'django-tastypie==0.12.1',
         'tastypie-async==0.1.1',
     ],
+    extras_require={
+        # vectorized RuleEngine.execute_batch
+        'batch': ['numpy'],
+    },
     dependency_links=[
         'https://github.com/miraculixx/tastypie-async/archive/0.1.1.zip#egg=tastypie-async-0.1.1'
     ]